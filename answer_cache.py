@@ -0,0 +1,128 @@
+import hashlib
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+# ---------------- Settings ---------------- #
+ANSWER_CACHE = (os.getenv("ANSWER_CACHE") or "0") not in ("0", "false", "no")  # off unless enabled
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD") or 0.95)  # cosine similarity of the questions
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE") or 1000)
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL") or 3600)  # seconds
+
+
+def context_key(*parts) -> str:
+    """Hash of everything besides the question that shapes an answer (system prompt, persona, context)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class SemanticAnswerCache:
+    """
+    Returns a stored LLM answer when a near-duplicate question is asked again.
+
+    Entries are grouped by ``context`` (see ``context_key``), so an answer is
+    only reused for the same system prompt or persona and the same retrieved
+    context. Within a group the question embedding with the highest cosine
+    similarity wins if it reaches ``threshold``. The cache holds at most
+    ``maxsize`` entries (least recently used are evicted first), and each entry
+    expires ``ttl`` seconds after it was stored.
+    """
+
+    def __init__(self, embedding_model=None, threshold: float = ANSWER_CACHE_THRESHOLD,
+                 maxsize: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL):
+        self._embedding_model = embedding_model
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._groups: Dict[str, Dict[int, tuple]] = {}  # context -> {entry id: (unit embedding, answer, expires_at)}
+        self._lru = OrderedDict()  # entry id -> context
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def embedding_model(self):
+        if self._embedding_model is None:
+            from embedding_service import get_embedding_service
+            self._embedding_model = get_embedding_service()
+        return self._embedding_model
+
+    def embed(self, question: str) -> np.ndarray:
+        return self._unit(self.embedding_model.encode(question.strip()))
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def _remove(self, entry_id: int):
+        context = self._lru.pop(entry_id)
+        group = self._groups[context]
+        del group[entry_id]
+        if not group:
+            del self._groups[context]
+
+    def lookup(self, context: str, question: str, embedding=None) -> Optional[str]:
+        """The cached answer for a near-duplicate of ``question`` under ``context``, if any."""
+        embedding = self._unit(embedding) if embedding is not None else self.embed(question)
+        now = time.monotonic()
+        with self._lock:
+            group = self._groups.get(context, {})
+            for entry_id in [i for i, entry in group.items() if entry[2] <= now]:
+                self._remove(entry_id)
+            group = self._groups.get(context)
+            if group:
+                ids = list(group)
+                scores = np.stack([group[i][0] for i in ids]) @ embedding
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self._lru.move_to_end(ids[best])
+                    self.hits += 1
+                    return group[ids[best]][1]
+            self.misses += 1
+            return None
+
+    def store(self, context: str, question: str, answer: str, embedding=None):
+        if self.maxsize <= 0:
+            return
+        embedding = self._unit(embedding) if embedding is not None else self.embed(question)
+        with self._lock:
+            entry_id = next(self._ids)
+            self._groups.setdefault(context, {})[entry_id] = (embedding, answer, time.monotonic() + self.ttl)
+            self._lru[entry_id] = context
+            while len(self._lru) > self.maxsize:
+                self._remove(next(iter(self._lru)))
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._lru),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> Optional[SemanticAnswerCache]:
+    """The process-wide answer cache, or None when ``ANSWER_CACHE`` is off."""
+    global _cache
+    if not ANSWER_CACHE:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = SemanticAnswerCache()
+        return _cache
@@ -0,0 +1,113 @@
+"""
+Headless batch runner: answers every prompt in a JSONL file concurrently.
+
+    python batch_chat.py prompts.jsonl responses.jsonl --concurrency 16
+
+Each input line is a JSON object with the prompt in ``--prompt-field``
+(default ``prompt``) and an optional id in ``--id-field`` (default ``id``; the
+line number is used otherwise). Records may carry a ``history`` and a
+``session`` id (default: the record id), which keeps a conversation on one
+Ollama server when several are configured. Each output line carries the id, prompt,
+response, latency in seconds and error, written as soon as the response
+finishes, so output order follows completion order. A line that is not a JSON
+object gets an error record with its line number as id.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from chat_engine import CHAT_CONCURRENCY, AsyncChatEngine
+from ollama_client import model_timings
+from stats import percentile
+
+_DONE = object()
+
+
+async def run_batch(input_path, output_path, concurrency=CHAT_CONCURRENCY, prompt_field="prompt",
+                    id_field="id", markdown=False):
+    engine = AsyncChatEngine(concurrency)
+    # A bounded queue keeps memory flat however large the input file is.
+    queue = asyncio.Queue(maxsize=concurrency * 4)
+    latencies, errors = [], 0
+    start = time.perf_counter()
+
+    async def worker(out):
+        nonlocal errors
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                return
+            line_no, record = item
+            if record.get(prompt_field) is None:
+                errors += 1
+                out.write(json.dumps({"id": record.get(id_field, line_no), "error": f"missing '{prompt_field}'"}) + "\n")
+                continue
+            result = await engine.chat(str(record[prompt_field]), record.get("history"),
+                                       record.get("markdown", markdown),
+                                       session=str(record.get("session", record.get(id_field, line_no))))
+            latencies.append(result.latency)
+            errors += result.error is not None
+            out.write(json.dumps({
+                "id": record.get(id_field, line_no),
+                "prompt": result.prompt,
+                "response": result.reply,
+                "latency_s": round(result.latency, 4),
+                "error": result.error,
+            }, ensure_ascii=False) + "\n")
+            out.flush()
+
+    try:
+        with open(input_path, encoding="utf-8") as src, open(output_path, "w", encoding="utf-8") as out:
+            workers = [asyncio.create_task(worker(out)) for _ in range(concurrency)]
+            for line_no, line in enumerate(src, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    error = None if isinstance(record, dict) else "not a JSON object"
+                except json.JSONDecodeError as e:
+                    error = f"invalid JSON: {e}"
+                if error is not None:
+                    errors += 1
+                    out.write(json.dumps({"id": line_no, "error": error}) + "\n")
+                    continue
+                await queue.put((line_no, record))
+            for _ in workers:
+                await queue.put(_DONE)
+            await asyncio.gather(*workers)
+    finally:
+        engine.close()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "requests_per_sec": round(len(latencies) / elapsed, 3) if elapsed > 0 else 0.0,
+        "latency_p50_s": round(percentile(latencies, 50), 4),
+        "latency_p95_s": round(percentile(latencies, 95), 4),
+        "latency_p99_s": round(percentile(latencies, 99), 4),
+        # Model load vs. generation time as reported by Ollama, so cold starts show up separately.
+        "model": model_timings.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of prompts concurrently.")
+    parser.add_argument("input", help="JSONL file with one prompt object per line")
+    parser.add_argument("output", help="JSONL file to write responses to")
+    parser.add_argument("--concurrency", type=int, default=CHAT_CONCURRENCY)
+    parser.add_argument("--prompt-field", default="prompt")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--markdown", action="store_true", help="ask for Markdown-formatted answers")
+    args = parser.parse_args()
+
+    summary = asyncio.run(run_batch(args.input, args.output, args.concurrency, args.prompt_field,
+                                    args.id_field, args.markdown))
+    print(json.dumps(summary), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+End-to-end performance benchmark: chunking, ingestion, retrieval and chat.
+
+    python benchmark.py --pdfs 5 --pages 40 --output bench.json
+    python benchmark.py --embedder hash --tokens-per-sec 80   # without loading the embedding model
+
+Synthetic PDFs of ``--pages`` pages and ``--words`` words per page are
+generated next to the bundled ``Civil-War-essay.pdf``, ingested into a
+temporary local vector store (``VECTOR_STORE=numpy``, no database server), and
+queried with questions made from stored chunks. Chat runs against a local mock
+Ollama server (see ``mock_ollama.py``) with the given latency and token rate,
+so results don't depend on a GPU or a real model.
+
+The JSON report (stdout, and ``--output`` if given) holds the settings, then
+per stage: chunking and ingestion throughput, retrieval latency p50/p95/p99,
+the time to remove each document again (the store must end up empty),
+chat time-to-first-token p50/p95/p99 (the first, cold call separately), and
+the process's peak RSS after each stage, so runs can be compared.
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from chat import ChatStream
+from chunker import DEFAULT_CHUNK_TOKENS, DEFAULT_OVERLAP_TOKENS, tokenizer_for
+from ingest import DEFAULT_BATCH_SIZE, EMBEDDING_DIM, ingest_document, remove_document
+from mock_ollama import (
+    DEFAULT_LATENCY, DEFAULT_LOAD_SECONDS, DEFAULT_REPLY_TOKENS, DEFAULT_TOKENS_PER_SEC, MockOllamaServer,
+)
+from ollama_client import OllamaClient, model_timings
+from pdf_extractor import extract_pdf_chunks, open_pdf, source_name
+from stats import percentile
+
+# ---------------- Settings ---------------- #
+BUNDLED_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Civil-War-essay.pdf")
+VOCABULARY = (
+    "union confederate army congress president senate war battle states treaty amendment slavery "
+    "emancipation reconstruction railroad frontier colony revolution constitution court election "
+    "territory tariff industry labor migration settlers river campaign general navy cotton"
+).split()
+WORDS_PER_LINE = 12
+LINE_HEIGHT = 11
+LINES_PER_PAGE = 64  # at 8pt on a Letter page
+
+# ---------------- Inputs ---------------- #
+
+def make_pdf(path: str, pages: int, words_per_page: int, seed: int = 0):
+    """Writes a PDF of pseudo-English pages; the same seed always gives the same text."""
+    import fitz
+
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        words = [rng.choice(VOCABULARY) for _ in range(words_per_page)]
+        lines = [" ".join(words[i:i + WORDS_PER_LINE]) + "." for i in range(0, len(words), WORDS_PER_LINE)]
+        for i, line in enumerate(lines[:LINES_PER_PAGE]):
+            page.insert_text((36, 36 + i * LINE_HEIGHT), line, fontsize=8)
+    doc.save(path)
+    doc.close()
+
+
+class HashingEmbedder:
+    """Stand-in embedding model: hashed bag of words, so the pipeline can be timed without the real model."""
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+
+    def encode(self, sentences, batch_size: Optional[int] = None, convert_to_numpy: bool = True, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                out[row, int(hashlib.md5(word.encode()).hexdigest()[:8], 16) % self.dim] += 1.0
+        out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-9)
+        return out[0] if single else out
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # bytes on macOS, KiB elsewhere
+
+
+def _latency_ms(values: List[float], prefix: str) -> Dict[str, float]:
+    return {f"{prefix}_p{pct}_ms": round(percentile(values, pct) * 1000, 3) for pct in (50, 95, 99)}
+
+# ---------------- Stages ---------------- #
+
+def bench_chunking(paths: List[str], tokenizer, chunk_size: int, overlap: int) -> Dict:
+    start = time.perf_counter()
+    pages = chunks = 0
+    for path in paths:
+        with open_pdf(path) as doc:
+            pages += doc.page_count
+        chunks += sum(1 for _ in extract_pdf_chunks(path, chunk_size, overlap, tokenizer=tokenizer))
+    elapsed = time.perf_counter() - start
+    return {"pages": pages, "chunks": chunks, "seconds": round(elapsed, 3),
+            "pages_per_sec": round(pages / elapsed, 2), "chunks_per_sec": round(chunks / elapsed, 2)}
+
+
+def bench_ingest(store, embedding_model, paths: List[str], chunk_size: int, overlap: int, batch_size: int) -> Dict:
+    start = time.perf_counter()
+    chunks, per_document = 0, []
+    for path in paths:
+        stats = ingest_document(store, embedding_model, path, None, chunk_size, overlap, batch_size)
+        chunks += stats["chunks"]
+        per_document.append(stats["seconds"])
+    elapsed = time.perf_counter() - start
+    return {"documents": len(paths), "chunks": chunks, "seconds": round(elapsed, 3),
+            "chunks_per_sec": round(chunks / elapsed, 2), **_latency_ms(per_document, "document")}
+
+
+def bench_retrieval(store, embedding_model, queries: List[str], top_k: int) -> Dict:
+    embed_times, search_times = [], []
+    for query in queries:
+        start = time.perf_counter()
+        query_emb = embedding_model.encode(query)
+        embedded = time.perf_counter()
+        store.search(query_emb, top_k)
+        embed_times.append(embedded - start)
+        search_times.append(time.perf_counter() - embedded)
+    total = [e + s for e, s in zip(embed_times, search_times)]
+    return {"queries": len(queries), "top_k": top_k, **_latency_ms(total, "latency"),
+            **_latency_ms(embed_times, "embed"), **_latency_ms(search_times, "search")}
+
+
+def bench_remove(store, paths: List[str]) -> Dict:
+    """Removes every document again; removing the last one compacts the store down to no rows at all."""
+    per_document = []
+    for path in paths:
+        start = time.perf_counter()
+        remove_document(store, source_name(path))
+        per_document.append(time.perf_counter() - start)
+    if store.sample_texts(1):
+        raise RuntimeError("chunks left in the store after removing every document")
+    return {"documents": len(paths), "seconds": round(sum(per_document), 3), **_latency_ms(per_document, "document")}
+
+
+def bench_chat(client, prompts: List[str], concurrency: int) -> Dict:
+    def one(prompt):
+        start = time.perf_counter()
+        first, tokens = None, 0
+        stream = ChatStream(prompt, client=client)
+        for _ in stream:
+            if first is None:
+                first = time.perf_counter() - start
+            tokens += 1
+        return first or 0.0, time.perf_counter() - start, tokens, stream.error
+
+    cold = one(prompts[0])  # the model is loaded on this one
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, prompts[1:]))
+    elapsed = time.perf_counter() - start
+    tokens = sum(r[2] for r in results)
+    return {
+        "requests": len(results),
+        "concurrency": concurrency,
+        "errors": sum(r[3] is not None for r in results) + (cold[3] is not None),
+        "cold_ttft_ms": round(cold[0] * 1000, 3),
+        **_latency_ms([r[0] for r in results], "ttft"),
+        **_latency_ms([r[1] for r in results], "total"),
+        "tokens_per_sec": round(tokens / elapsed, 2) if elapsed > 0 else 0.0,
+        "model": model_timings.stats(),
+    }
+
+# ---------------- Run ---------------- #
+
+def run_benchmark(args) -> Dict:
+    from numpy_store import NumpyVectorStore
+
+    workdir = tempfile.mkdtemp(prefix="pdf-bench-")
+    try:
+        paths = [BUNDLED_PDF] if args.bundled and os.path.exists(BUNDLED_PDF) else []
+        for i in range(args.pdfs):
+            path = os.path.join(workdir, f"synthetic-{i}.pdf")
+            make_pdf(path, args.pages, args.words, seed=args.seed + i)
+            paths.append(path)
+
+        if args.embedder == "hash":
+            embedding_model = HashingEmbedder()
+        else:
+            from embedding_service import get_embedding_service
+            embedding_model = get_embedding_service()
+            embedding_model.warm_up()  # model load isn't ingestion throughput
+        tokenizer = tokenizer_for(embedding_model)
+        report = {
+            "settings": {**vars(args), "python": platform.python_version(), "platform": platform.platform(),
+                         "cpus": os.cpu_count()},
+        }
+
+        report["chunking"] = bench_chunking(paths, tokenizer, args.chunk_size, args.overlap)
+        report["chunking"]["peak_rss_mb"] = peak_rss_mb()
+
+        store = NumpyVectorStore(os.path.join(workdir, "store"))
+        report["ingest"] = bench_ingest(store, embedding_model, paths, args.chunk_size, args.overlap, args.batch_size)
+        report["ingest"]["peak_rss_mb"] = peak_rss_mb()
+
+        rng = random.Random(args.seed)
+        samples = store.sample_texts(max(args.queries, args.chats))
+        queries = [" ".join(text.split()[:8]) for text in rng.choices(samples, k=args.queries)]
+        report["retrieval"] = bench_retrieval(store, embedding_model, queries, args.top_k)
+        report["retrieval"]["peak_rss_mb"] = peak_rss_mb()
+
+        report["remove"] = bench_remove(store, paths)
+        report["remove"]["peak_rss_mb"] = peak_rss_mb()
+
+        prompts = [f"What does the document say about {' '.join(text.split()[:4])}?"
+                   for text in rng.choices(samples, k=args.chats + 1)]
+        with MockOllamaServer(tokens_per_sec=args.tokens_per_sec, latency=args.latency,
+                              load_seconds=args.load_seconds, reply_tokens=args.reply_tokens) as server:
+            client = OllamaClient(server.url, pool_size=args.chat_concurrency)
+            report["chat"] = bench_chat(client, prompts, args.chat_concurrency)
+            client.close()
+        report["chat"]["peak_rss_mb"] = peak_rss_mb()
+        report["peak_rss_mb"] = peak_rss_mb()
+        return report
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, retrieval and chat against local stand-ins.")
+    parser.add_argument("--pdfs", type=int, default=3, help="synthetic PDFs to generate")
+    parser.add_argument("--pages", type=int, default=20, help="pages per synthetic PDF")
+    parser.add_argument("--words", type=int, default=400, help="words per synthetic page")
+    parser.add_argument("--no-bundled", dest="bundled", action="store_false", help="leave out Civil-War-essay.pdf")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--embedder", choices=["model", "hash"], default="model",
+                        help="the real embedding model, or a hashing stand-in")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_TOKENS)
+    parser.add_argument("--overlap", type=int, default=DEFAULT_OVERLAP_TOKENS)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--chat-concurrency", type=int, default=4)
+    parser.add_argument("--tokens-per-sec", type=float, default=DEFAULT_TOKENS_PER_SEC, help="mock Ollama token rate")
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY, help="mock Ollama seconds to first token")
+    parser.add_argument("--load-seconds", type=float, default=DEFAULT_LOAD_SECONDS, help="mock Ollama cold load")
+    parser.add_argument("--reply-tokens", type=int, default=DEFAULT_REPLY_TOKENS)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
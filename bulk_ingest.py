@@ -0,0 +1,362 @@
+"""
+Headless bulk ingestion of a directory tree of PDFs.
+
+    python bulk_ingest.py ./papers --workers 6 --checkpoint papers.ckpt.jsonl
+
+Extraction, chunking, embedding and database writes run as overlapping
+pipeline stages connected by bounded queues:
+
+- a process pool parses PDFs with PyMuPDF and chunks them (``--workers``),
+- one embedding thread batches chunks across documents into forward passes,
+- one writer thread stores each document in its own transaction.
+
+Documents are stored under their path relative to the root, so files with the
+same name in different folders don't collide. Every finished file is appended
+to the checkpoint (JSONL) once its transaction has committed; a rerun skips
+files recorded there whose size and modification time are unchanged, so an
+interrupted run resumes where it left off. Content already in the manifest
+with the same chunking is skipped before it is embedded. Files that fail are
+recorded with their error and retried on the next run.
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional
+
+import manifest
+import term_stats
+import tracing
+from chunker import DEFAULT_CHUNK_TOKENS, DEFAULT_OVERLAP_TOKENS, Chunker, tokenizer_for
+from ingest import DEFAULT_BATCH_SIZE
+from pdf_extractor import extract_text_by_page
+from stats import percentile
+
+# ---------------- Settings ---------------- #
+BULK_WORKERS = int(os.getenv("BULK_INGEST_WORKERS") or max((os.cpu_count() or 2) - 1, 1))
+QUEUE_DOCUMENTS = int(os.getenv("BULK_INGEST_QUEUE") or 8)  # parsed documents waiting per stage
+PROGRESS_EVERY = 5.0  # seconds between progress lines
+
+DONE, SKIPPED, FAILED = "done", "skipped", "failed"
+_END = object()
+
+# ---------------- Parsing (worker processes) ---------------- #
+
+_chunker = None
+
+
+def _init_worker(tokenizer, chunk_size: int, overlap: int):
+    # The tokenizer is pickled once per worker; the embedding model itself stays in the parent.
+    global _chunker
+    _chunker = Chunker(tokenizer, chunk_size, overlap)
+
+
+def parse_pdf(path: str, filename: str, state: Dict) -> Dict:
+    """Extracts, hashes, counts terms in and chunks one PDF; runs in a worker process."""
+    try:
+        hashes, terms = {}, Counter()
+
+        def pages():
+            for page in extract_text_by_page(path, filename):
+                hashes[page["page_number"]] = manifest.text_hash(page["text"])
+                terms.update(term_stats.extract_terms(page["text"]))
+                yield page
+
+        chunks = list(_chunker.chunk_pages(pages()))
+        return {"filename": filename, "state": state, "file_hash": manifest.hash_file(path),
+                "hashes": hashes, "terms": terms, "chunks": chunks, "error": None}
+    except Exception as e:
+        return {"filename": filename, "state": state, "error": f"{type(e).__name__}: {e}"}
+
+# ---------------- Checkpoint ---------------- #
+
+def file_state(path: str) -> Dict:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def load_checkpoint(path: str) -> Dict[str, Dict]:
+    """Latest checkpoint entry per file; a line torn by an interrupted write is ignored."""
+    entries = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            entries[entry["path"]] = entry
+    return entries
+
+
+def find_pdfs(root: str) -> Iterator[str]:
+    for folder, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(".pdf"):
+                yield os.path.join(folder, name)
+
+# ---------------- Pipeline ---------------- #
+
+class BulkIngester:
+    """
+    Runs the bulk ingestion pipeline over one directory tree.
+
+    ``workers`` parsing processes feed a queue of at most ``queue_size``
+    parsed documents; the embedding thread passes embedded documents to the
+    writer through a queue of the same size. Full queues block the stage
+    before them, so memory stays bounded however fast parsing runs.
+    """
+
+    def __init__(self, store, embedding_model, checkpoint_path: str, chunk_size: int = DEFAULT_CHUNK_TOKENS,
+                 overlap: int = DEFAULT_OVERLAP_TOKENS, batch_size: int = DEFAULT_BATCH_SIZE,
+                 workers: int = BULK_WORKERS, queue_size: int = QUEUE_DOCUMENTS):
+        self.store = store
+        self.embedding_model = embedding_model
+        self.checkpoint_path = checkpoint_path
+        self.tokenizer = tokenizer_for(embedding_model)
+        self.chunk_size = Chunker(self.tokenizer, chunk_size, overlap).chunk_tokens
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.workers = workers
+        self.queue_size = queue_size
+        self.counts = {DONE: 0, SKIPPED: 0, FAILED: 0}
+        self.chunks = 0
+        self.embed_seconds = []  # per forward pass
+        self._stop = threading.Event()
+        self._errors = []
+
+    # ---------------- Stages ---------------- #
+
+    def _parse(self, todo: List[tuple], parsed: queue.Queue):
+        """Keeps a bounded window of files in the process pool and hands results on as they finish."""
+        pending = iter(todo)
+        try:
+            with ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                     initargs=(self.tokenizer, self.chunk_size, self.overlap)) as pool:
+                running = set()
+                while not self._stop.is_set():
+                    for args in pending:
+                        running.add(pool.submit(parse_pdf, *args))
+                        if len(running) >= self.workers * 2:
+                            break
+                    if not running:
+                        break
+                    finished, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        parsed.put(future.result())  # the embedding thread drains the queue even when it fails
+                if running:
+                    pool.shutdown(cancel_futures=True)  # stopping: files not started yet are dropped
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            parsed.put(_END)
+
+    def _embed(self, parsed: queue.Queue, embedded: queue.Queue):
+        """Embeds chunks in full batches that may span several documents, passing documents on in order."""
+        waiting = []  # documents whose chunks are not all embedded yet
+        batch = []  # chunk records awaiting a forward pass
+        ended = False
+        try:
+            while not self._stop.is_set():
+                try:
+                    # Wait briefly so small documents share batches, but never leave a partial batch idle.
+                    doc = parsed.get(timeout=0.05 if batch else None)
+                except queue.Empty:
+                    doc = None
+                if doc is _END:
+                    ended = True
+                    break
+                if doc is not None:
+                    if doc["error"] is None:
+                        doc["existing"] = self._existing(doc)
+                    if doc.get("existing") is not None:
+                        doc["skipped"], doc["chunks"] = True, []
+                    waiting.append(doc)
+                    batch.extend(doc.get("chunks") or [])
+                while batch and (doc is None or len(batch) >= self.batch_size):
+                    self._encode(batch[:self.batch_size])
+                    batch = batch[self.batch_size:]
+                while waiting and all("embedding" in chunk for chunk in waiting[0].get("chunks") or []):
+                    embedded.put(waiting.pop(0))
+            if ended:
+                while batch:
+                    self._encode(batch[:self.batch_size])
+                    batch = batch[self.batch_size:]
+                for doc in waiting:
+                    embedded.put(doc)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            embedded.put(_END)
+            while not ended:  # unblock the parsing thread, which stops at its next check
+                ended = parsed.get() is _END
+
+    def _encode(self, batch: List[Dict]):
+        start = time.perf_counter()
+        tracing.count("chunks_embedded", len(batch))
+        with tracing.span("embed"):
+            embeddings = self.embedding_model.encode([chunk["text"] for chunk in batch],
+                                                     batch_size=self.batch_size, convert_to_numpy=True)
+        self.embed_seconds.append(time.perf_counter() - start)
+        for chunk, emb in zip(batch, embeddings):
+            chunk["embedding"] = emb
+
+    def _existing(self, doc: Dict) -> Optional[str]:
+        with self.store.engine.connect() as conn:
+            return manifest.find_document(conn, doc["file_hash"], self.chunk_size, self.overlap)
+
+    def _backfill_terms(self, doc: Dict):
+        """Term counts for a skipped document ingested before they were kept, as in ``ingest_document``."""
+        with self.store.engine.begin() as conn:
+            self.store.lock_writes(conn)
+            if not term_stats.has_document_terms(conn, doc["existing"]):
+                term_stats.record_document_terms(conn, doc["existing"], doc["terms"])
+
+    def _write(self, embedded: queue.Queue, checkpoint):
+        """Stores each document in one transaction, then records it in the checkpoint."""
+        try:
+            while True:
+                doc = embedded.get()
+                if doc is _END:
+                    return
+                entry = {"path": doc["filename"], **doc["state"], "error": doc["error"]}
+                if doc["error"] is not None:
+                    entry["status"] = FAILED
+                elif doc.get("skipped"):
+                    try:
+                        self._backfill_terms(doc)
+                        entry["status"] = SKIPPED
+                    except Exception as e:
+                        entry.update(status=FAILED, error=f"{type(e).__name__}: {e}")
+                else:
+                    try:
+                        entry["chunks"] = self.write_document(doc)
+                        entry["status"] = DONE
+                        self.chunks += entry["chunks"]
+                    except Exception as e:
+                        entry.update(status=FAILED, error=f"{type(e).__name__}: {e}")
+                self.counts[entry["status"]] += 1
+                checkpoint.write(json.dumps(entry) + "\n")
+                checkpoint.flush()
+                os.fsync(checkpoint.fileno())
+        except BaseException as e:
+            self._fail(e)
+            while embedded.get() is not _END:  # unblock the embedding thread
+                pass
+
+    @tracing.traced("write_document")
+    def write_document(self, doc: Dict) -> int:
+        """Replaces the document's rows, manifest entry and term counts; bumps the corpus version."""
+        filename = doc["filename"]
+        with self.store.engine.begin() as conn:
+            self.store.lock_writes(conn)
+            self.store.delete_chunks(conn, filename)
+            count = self.store.write_chunks(conn, self.embedding_model, doc["chunks"], self.batch_size)
+            manifest.record_document(conn, filename, doc["file_hash"], self.chunk_size, self.overlap, doc["hashes"])
+            term_stats.record_document_terms(conn, filename, doc["terms"])
+            manifest.bump_corpus_version(conn)
+        return count
+
+    def _fail(self, error: BaseException):
+        self._errors.append(error)
+        self._stop.set()
+
+    # ---------------- Run ---------------- #
+
+    def run(self, root: str, retry_failed: bool = True, progress: bool = True) -> Dict:
+        start = time.perf_counter()
+        with self.store.engine.begin() as conn:
+            manifest.ensure_manifest(conn)
+            term_stats.ensure_term_tables(conn)
+            self.store.prepare(conn)
+
+        done = load_checkpoint(self.checkpoint_path)
+        todo, resumed = [], 0
+        for path in find_pdfs(root):
+            filename = os.path.relpath(path, root).replace(os.sep, "/")
+            state = file_state(path)
+            entry = done.get(filename)
+            if (entry and (entry["size"], entry["mtime_ns"]) == (state["size"], state["mtime_ns"])
+                    and (entry["status"] != FAILED or not retry_failed)):
+                resumed += 1
+                continue
+            todo.append((path, filename, state))
+
+        parsed = queue.Queue(maxsize=self.queue_size)
+        embedded = queue.Queue(maxsize=self.queue_size)
+        with open(self.checkpoint_path, "a", encoding="utf-8") as checkpoint:
+            threads = [
+                threading.Thread(target=self._parse, args=(todo, parsed), name="bulk-parse", daemon=True),
+                threading.Thread(target=self._embed, args=(parsed, embedded), name="bulk-embed", daemon=True),
+                threading.Thread(target=self._write, args=(embedded, checkpoint), name="bulk-write", daemon=True),
+            ]
+            for thread in threads:
+                thread.start()
+            try:
+                last = time.perf_counter()
+                while threads[-1].is_alive():
+                    threads[-1].join(0.5)
+                    if progress and time.perf_counter() - last >= PROGRESS_EVERY:
+                        last = time.perf_counter()
+                        finished = sum(self.counts.values())
+                        print(f"{finished}/{len(todo)} files, {self.chunks} chunks, "
+                              f"{self.chunks / (last - start):.1f} chunks/sec", file=sys.stderr)
+            except KeyboardInterrupt:
+                # Committed documents are already in the checkpoint; the rest is redone on the next run.
+                self._stop.set()
+                raise
+            for thread in threads:
+                thread.join()
+
+        if self._errors:
+            raise self._errors[0]
+        self.store.after_ingest()
+        elapsed = time.perf_counter() - start
+        return {
+            "files": len(todo),
+            "resumed": resumed,
+            "ingested": self.counts[DONE],
+            "skipped": self.counts[SKIPPED],
+            "failed": self.counts[FAILED],
+            "chunks": self.chunks,
+            "seconds": round(elapsed, 3),
+            "chunks_per_sec": round(self.chunks / elapsed, 3) if elapsed > 0 else 0.0,
+            "embed_batches": len(self.embed_seconds),
+            "embed_batch_p50_s": round(percentile(self.embed_seconds, 50), 4),
+            "embed_batch_p95_s": round(percentile(self.embed_seconds, 95), 4),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest every PDF under a directory with a pipelined worker pool.")
+    parser.add_argument("root", help="directory to search for PDFs (recursively)")
+    parser.add_argument("--checkpoint", help="JSONL checkpoint file (default: <root>/.bulk_ingest.jsonl)")
+    parser.add_argument("--workers", type=int, default=BULK_WORKERS, help="PDF parsing processes")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_DOCUMENTS)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_TOKENS)
+    parser.add_argument("--overlap", type=int, default=DEFAULT_OVERLAP_TOKENS)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--no-retry-failed", action="store_true", help="skip files that failed on an earlier run")
+    parser.add_argument("--quiet", action="store_true", help="no progress lines")
+    args = parser.parse_args()
+
+    from embedding_service import get_embedding_service
+    from vector_store import open_store
+
+    tracing.serve_metrics()
+    ingester = BulkIngester(open_store(), get_embedding_service(),
+                            args.checkpoint or os.path.join(args.root, ".bulk_ingest.jsonl"),
+                            args.chunk_size, args.overlap, args.batch_size, args.workers, args.queue_size)
+    summary = ingester.run(args.root, retry_failed=not args.no_retry_failed, progress=not args.quiet)
+    print(json.dumps(summary), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
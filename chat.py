@@ -1,13 +1,10 @@
 import requests
 import json
-import dotenv
-import os
 
-# Load environment variables from .env file
-dotenv.load_dotenv()
-
-MODEL = os.getenv("MODEL")
-OLLAMA_URL = os.getenv("OLLAMA_URL")
+import tracing
+from answer_cache import context_key, get_answer_cache
+from chat_context import get_chat_context
+from ollama_client import get_client, model_timings
 
 # Base system prompt for math-only interactions
 # This will be extended if markdown formatting is requested.
@@ -39,7 +36,127 @@ No need to overdo the textbook speak. Be sharp, be clear, and be fun. Make jokes
 """
 
 
-def chat_with_llm(prompt, history=None, enable_markdown_output=False):
+def build_system_prompt(enable_markdown_output=False):
+    # Construct the system prompt for the current interaction
+    current_system_prompt = HISTORY_SYSTEM_PROMPT_BASE
+
+    # If markdown output is enabled, add a specific instruction to the system prompt
+    if enable_markdown_output:
+        current_system_prompt += (
+            "\n\n**IMPORTANT:** Format your responses concisely and use Markdown for readability. "
+            "Use bold (`**text**`) for emphasis, code blocks for equations (````python print('math') ````), "
+            "and ensure double newlines (`\\n\\n`) between paragraphs for proper formatting."
+        )
+    return current_system_prompt
+
+
+class ChatStream:
+    """
+    Iterating over a ChatStream yields the assistant's reply token by token as
+    Ollama streams it. Once iteration finishes, ``reply`` holds the full text and
+    ``history`` the updated chat history. On an API error the error message is
+    yielded as the reply and ``history`` is left unchanged.
+
+    With ``ANSWER_CACHE`` enabled, a near-duplicate of a question already
+    answered with the same system prompt and history is answered from
+    ``answer_cache`` (yielded as a single token, ``cached`` set) without
+    calling Ollama.
+
+    ``session`` identifies the conversation across turns, so a pool of Ollama
+    servers keeps sending it to the same one (see ``ollama_client.OllamaPool``).
+    """
+
+    def __init__(self, prompt, history=None, enable_markdown_output=False, client=None, context=None,
+                 answer_cache=None, session=None):
+        self.prompt = prompt
+        self.session = session
+        self.client = client
+        self.context = context
+        self.answer_cache = answer_cache
+        self.history = history or []
+        self.enable_markdown_output = enable_markdown_output
+        self.reply = ""
+        self.error = None
+        self.cached = False
+
+    def _finish(self, history, reply):
+        self.reply = reply
+        # Update history for the next turn
+        self.history = history + [
+            {"role": "user", "content": self.prompt},
+            {"role": "assistant", "content": self.reply}
+        ]
+
+    def __iter__(self):
+        history = self.history
+        system_prompt = build_system_prompt(self.enable_markdown_output)
+
+        answer_cache = self.answer_cache or get_answer_cache()
+        if answer_cache is not None:
+            cache_context = context_key(system_prompt, json.dumps(history))
+            question_emb = answer_cache.embed(self.prompt)
+            cached = answer_cache.lookup(cache_context, self.prompt, question_emb)
+            if cached is not None:
+                tracing.count("answer_cache_hits")
+                self.cached = True
+                self._finish(history, cached)
+                yield cached
+                return
+
+        # Construct the messages list to send to Ollama, keeping older turns
+        # within the token budget (see chat_context.ChatContext)
+        messages_to_send = (self.context or get_chat_context()).build_messages(
+            system_prompt, history, self.prompt
+        )
+
+        try:
+            with tracing.span("ollama"):
+                response = (self.client or get_client()).chat(messages_to_send, stream=True, session=self.session)
+        except requests.exceptions.RequestException as e:
+            self.error = self.reply = f"❌ API error: {e}"
+            yield self.reply
+            return
+
+        parts = []
+        try:
+            with response:
+                for line in tracing.timed("ollama", response.iter_lines()):
+                    if not line:
+                        continue
+                    try:
+                        chunk = json.loads(line.decode("utf-8"))
+                    except json.JSONDecodeError:
+                        # Skip lines that are not valid JSON (e.g., keep-alive pings)
+                        continue
+                    token = chunk.get("message", {}).get("content", "")
+                    if token:
+                        parts.append(token)
+                        yield token
+                    if chunk.get("done"):
+                        model_timings.record(chunk)
+                        break
+        except Exception as e:
+            self.error = self.reply = f"❌ Error reading response: {e}"
+            yield f"\n\n{self.reply}"
+            return
+
+        self._finish(history, "".join(parts))
+        if answer_cache is not None and self.reply:
+            answer_cache.store(cache_context, self.prompt, self.reply, question_emb)
+
+
+def stream_chat_with_llm(prompt, history=None, enable_markdown_output=False, client=None, session=None):
+    """
+    Streaming variant of ``chat_with_llm``.
+
+    Returns:
+        ChatStream: iterate it to receive tokens as they arrive, then read
+                    ``reply`` and ``history`` from it.
+    """
+    return ChatStream(prompt, history, enable_markdown_output, client, session=session)
+
+
+def chat_with_llm(prompt, history=None, enable_markdown_output=False, session=None):
     """
     Interacts with the LLM, enforcing a american history-only persona.
 
@@ -49,60 +166,12 @@ def chat_with_llm(prompt, history=None, enable_markdown_output=False):
                              [{"role": "user", "content": "..."}]
         enable_markdown_output (bool): If True, the LLM will be prompted to
                                        format its response using Markdown.
+        session (str): Optional id of the conversation, kept the same across turns.
 
     Returns:
         tuple[str, list]: The LLM's reply and the updated chat history.
     """
-    history = history or []
-
-    # Construct the system prompt for the current interaction
-    current_system_prompt = HISTORY_SYSTEM_PROMPT_BASE
-
-    # If markdown output is enabled, add a specific instruction to the system prompt
-    if enable_markdown_output:
-        current_system_prompt += (
-            "\n\n**IMPORTANT:** Format your responses concisely and use Markdown for readability. "
-            "Use bold (`**text**`) for emphasis, code blocks for equations (````python print('math') ````), "
-            "and ensure double newlines (`\\n\\n`) between paragraphs for proper formatting."
-        )
-
-    # Construct the messages list to send to Ollama
-    messages_to_send = [
-        {"role": "system", "content": current_system_prompt}
-    ] + history + [
-        {"role": "user", "content": prompt}
-    ]
-
-    payload = {
-        "model": MODEL,
-        "messages": messages_to_send,
-        "stream": True
-    }
-
-    try:
-        response = requests.post(OLLAMA_URL, json=payload, stream=True)
-        response.raise_for_status()
-    except requests.exceptions.RequestException as e:
-        return f"❌ API error: {e}", history
-
-    assistant_reply = ""
-
-    try:
-        for line in response.iter_lines():
-            if line:
-                try:
-                    chunk = json.loads(line.decode("utf-8"))
-                    # Concatenate content from streamed chunks
-                    assistant_reply += chunk.get("message", {}).get("content", "")
-                except json.JSONDecodeError:
-                    # Skip lines that are not valid JSON (e.g., keep-alive pings)
-                    continue
-    except Exception as e:
-        return f"❌ Error reading response: {e}", history
-
-    # Update history for the next turn
-    updated_history = history + [
-        {"role": "user", "content": prompt},
-        {"role": "assistant", "content": assistant_reply}
-    ]
-    return assistant_reply, updated_history
\ No newline at end of file
+    stream = stream_chat_with_llm(prompt, history, enable_markdown_output, session=session)
+    for _ in stream:
+        pass
+    return stream.reply, stream.history
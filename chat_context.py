@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+import requests
+
+from ollama_client import get_client
+
+# ---------------- Settings ---------------- #
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS") or 2048)  # 0 disables the budget
+CHAT_KEEP_RECENT = int(os.getenv("CHAT_KEEP_RECENT") or 4)  # messages always sent verbatim when they fit
+SUMMARY_MAX_WORDS = 150
+# After a summary fold the verbatim history fills at most this share of its budget,
+# so the next few turns fit without summarizing again.
+LOW_WATERMARK = 0.6
+SUMMARY_CACHE_SIZE = 256
+
+CHARS_PER_TOKEN = 4  # rough average for English text with Llama-style tokenizers
+MESSAGE_OVERHEAD_TOKENS = 4  # role and separators added by the chat template
+
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a user and an assistant.
+Update the summary with the new messages below. Keep names, dates, facts and open questions, drop small talk.
+Reply with the updated summary only, in at most {max_words} words.
+
+Current summary:
+{summary}
+
+New messages:
+{transcript}
+"""
+
+# ---------------- Token counting ---------------- #
+
+def count_tokens(text: str) -> int:
+    """Cheap token estimate; it only has to be consistent, not exact."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def count_message_tokens(message: dict) -> int:
+    return count_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+
+
+def _prefix_hashes(history: List[dict]) -> List[str]:
+    """hashes[i] identifies history[:i]; each step hashes one message onto the previous digest."""
+    hashes = [""]
+    for message in history:
+        digest = hashlib.sha256(hashes[-1].encode())
+        digest.update(json.dumps([message.get("role"), message.get("content")]).encode())
+        hashes.append(digest.hexdigest())
+    return hashes
+
+
+def summarize_with_llm(summary: str, messages: List[dict]) -> str:
+    transcript = "\n".join(f"{m['role'].capitalize()}: {m['content']}" for m in messages)
+    return get_client().generate(SUMMARY_PROMPT.format(
+        max_words=SUMMARY_MAX_WORDS, summary=summary or "(none yet)", transcript=transcript,
+    )).strip()
+
+# ---------------- Context manager ---------------- #
+
+class ChatContext:
+    """
+    Keeps the prompt sent for each chat turn within a token budget.
+
+    The most recent messages are sent verbatim. Older ones are folded into a
+    rolling summary that is appended to the system prompt. Summaries are cached
+    by a hash of the history prefix they cover, so they are only recomputed when
+    more messages fall out of the window. Only the newly evicted messages are
+    folded into the previous summary, never the whole history.
+    """
+
+    def __init__(self, budget: int = CHAT_CONTEXT_TOKENS, keep_recent: int = CHAT_KEEP_RECENT,
+                 summarize: Callable[[str, List[dict]], str] = summarize_with_llm,
+                 cache_size: int = SUMMARY_CACHE_SIZE):
+        self.budget = budget
+        self.keep_recent = keep_recent
+        self.summarize = summarize
+        self.cache_size = cache_size
+        self._summaries = OrderedDict()  # prefix hash -> summary
+        self._lock = threading.Lock()
+
+    def _cached(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key in self._summaries:
+                self._summaries.move_to_end(key)
+                return self._summaries[key]
+        return None
+
+    def _store(self, key: str, summary: str):
+        with self._lock:
+            self._summaries[key] = summary
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+
+    def _boundary(self, hashes: List[str]) -> Tuple[int, str]:
+        """Longest history prefix that already has a summary."""
+        for i in range(len(hashes) - 1, 0, -1):
+            summary = self._cached(hashes[i])
+            if summary is not None:
+                return i, summary
+        return 0, ""
+
+    def _choose_boundary(self, history: List[dict], costs: List[int], start: int, available: int) -> int:
+        n = len(history)
+        tail = sum(costs[start:])
+        k = start
+        # Evict down to the low watermark, but keep the most recent messages...
+        while k < n - self.keep_recent and tail > available * LOW_WATERMARK:
+            tail -= costs[k]
+            k += 1
+        # ...unless even they don't fit the budget.
+        while k < n and tail > available:
+            tail -= costs[k]
+            k += 1
+        # Start the verbatim part on a user turn so question and answer stay together.
+        while k < n and history[k].get("role") != "user":
+            k += 1
+        return k
+
+    def build_messages(self, system_prompt: str, history: Optional[list], prompt: str) -> List[dict]:
+        """Messages to send for this turn: system prompt (+ summary), recent history, new prompt."""
+        history = list(history or [])
+        if self.budget <= 0:
+            return [{"role": "system", "content": system_prompt}] + history + [{"role": "user", "content": prompt}]
+
+        summary_reserve = SUMMARY_MAX_WORDS * 2
+        fixed = count_tokens(system_prompt) + count_tokens(prompt) + 2 * MESSAGE_OVERHEAD_TOKENS + summary_reserve
+        available = max(self.budget - fixed, 0)
+        costs = [count_message_tokens(m) for m in history]
+
+        hashes = _prefix_hashes(history)
+        start, summary = self._boundary(hashes)
+        if sum(costs[start:]) > available:
+            k = self._choose_boundary(history, costs, start, available)
+            try:
+                summary = self.summarize(summary, history[start:k])
+                self._store(hashes[k], summary)
+                start = k
+            except requests.exceptions.RequestException:
+                # Keep the old summary and still trim; the fold is retried next turn.
+                start = k
+
+        system_content = system_prompt
+        if summary:
+            system_content += f"\n\nSummary of the earlier conversation:\n{summary}"
+        return (
+            [{"role": "system", "content": system_content}]
+            + history[start:]
+            + [{"role": "user", "content": prompt}]
+        )
+
+
+_context = None
+_context_lock = threading.Lock()
+
+
+def get_chat_context() -> ChatContext:
+    global _context
+    with _context_lock:
+        if _context is None:
+            _context = ChatContext()
+        return _context
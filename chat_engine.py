@@ -0,0 +1,65 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+from chat import stream_chat_with_llm
+from ollama_client import OllamaClient, make_client
+
+# ---------------- Settings ---------------- #
+CHAT_CONCURRENCY = int(os.getenv("CHAT_CONCURRENCY") or 8)
+
+# ---------------- Engine ---------------- #
+
+@dataclass
+class ChatResult:
+    prompt: str
+    reply: str
+    history: list
+    latency: float
+    error: Optional[str] = None
+
+
+class AsyncChatEngine:
+    """
+    Runs many ``chat_with_llm`` conversations concurrently from asyncio code.
+
+    At most ``concurrency`` requests are in flight at once. Each one runs the
+    blocking, streaming Ollama call on a worker thread with its own pooled
+    keep-alive connection, so the event loop never blocks and retry/timeout
+    policy stays the one in ``ollama_client``.
+    """
+
+    def __init__(self, concurrency: int = CHAT_CONCURRENCY, client: Optional[OllamaClient] = None):
+        self.concurrency = concurrency
+        self.client = client or make_client(pool_size=concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="chat")
+        self._semaphore = None
+
+    def _run(self, prompt: str, history: Optional[list], enable_markdown_output: bool,
+             session: Optional[str]) -> ChatResult:
+        start = time.perf_counter()
+        stream = stream_chat_with_llm(prompt, history, enable_markdown_output, client=self.client, session=session)
+        for _ in stream:
+            pass
+        return ChatResult(prompt, stream.reply, stream.history, time.perf_counter() - start, stream.error)
+
+    async def chat(self, prompt: str, history: Optional[list] = None, enable_markdown_output: bool = False,
+                   session: Optional[str] = None) -> ChatResult:
+        if self._semaphore is None:
+            # Created on first use so it binds to the running event loop.
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._run, prompt, history,
+                                              enable_markdown_output, session)
+
+    async def chat_many(self, prompts: Iterable[str], enable_markdown_output: bool = False) -> List[ChatResult]:
+        """Answers independent single-turn prompts concurrently, returning results in input order."""
+        return await asyncio.gather(*(self.chat(p, None, enable_markdown_output) for p in prompts))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.client.close()
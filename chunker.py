@@ -0,0 +1,128 @@
+import os
+import re
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+# ---------------- Settings ---------------- #
+# all-MiniLM-L6-v2 reads at most 256 word pieces, two of which are [CLS] and [SEP].
+DEFAULT_CHUNK_TOKENS = 254
+DEFAULT_OVERLAP_TOKENS = 32
+SPAN_PAGES = (os.getenv("CHUNK_SPAN_PAGES") or "1") not in ("0", "false", "no")
+PAGE_SEPARATOR = "\n"  # how a chunk that runs onto the next page joins the two page texts
+
+Span = Tuple[int, int]
+
+# ---------------- Tokenizers ---------------- #
+
+class HFTokenizer:
+    """Token offsets from a Hugging Face fast tokenizer, e.g. a SentenceTransformer's."""
+
+    def __init__(self, tokenizer, max_tokens: int):
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+
+    def token_spans(self, text: str) -> List[Span]:
+        if not text:
+            return []
+        encoding = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True,
+                                  truncation=False, verbose=False)
+        return [(start, end) for start, end in encoding["offset_mapping"] if end > start]
+
+
+class RegexTokenizer:
+    """Whitespace-delimited words; used when the embedding model has no fast tokenizer."""
+
+    def __init__(self, max_tokens: int = 200):
+        self.max_tokens = max_tokens
+
+    def token_spans(self, text: str) -> List[Span]:
+        return [m.span() for m in re.finditer(r"\S+", text)]
+
+
+def tokenizer_for(embedding_model=None):
+    """The tokenizer the embedding model itself uses, so chunks are sized in the tokens it actually reads."""
+    if embedding_model is None:
+        from embedding_service import get_embedding_service
+        embedding_model = get_embedding_service()
+    model = getattr(embedding_model, "model", embedding_model)  # EmbeddingService wraps the model
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is not None and getattr(tokenizer, "is_fast", False):
+        max_seq_length = getattr(model, "max_seq_length", None) or DEFAULT_CHUNK_TOKENS + 2
+        return HFTokenizer(tokenizer, max_seq_length - 2)
+    return RegexTokenizer()
+
+# ---------------- Chunking ---------------- #
+
+class Chunker:
+    """
+    Splits page text into windows of at most ``chunk_tokens`` model tokens.
+
+    Chunks are described by character offsets into the page text; the chunk
+    text is a single slice of the page, never a re-joined word list. With
+    ``span_pages`` the last, short window of a page is filled up with the start
+    of the next page, so text at a page break is embedded in one piece. Offsets
+    past the end of the page continue into the next page's text after
+    ``PAGE_SEPARATOR``. Every other window depends only on its own page.
+    """
+
+    def __init__(self, tokenizer=None, chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+                 overlap_tokens: int = DEFAULT_OVERLAP_TOKENS, span_pages: bool = SPAN_PAGES):
+        self.tokenizer = tokenizer or RegexTokenizer()
+        self.chunk_tokens = min(chunk_tokens, self.tokenizer.max_tokens)
+        self.overlap_tokens = overlap_tokens
+        self.span_pages = span_pages
+        if not 0 <= self.overlap_tokens < self.chunk_tokens:
+            raise ValueError("overlap must be smaller than the chunk size")
+
+    def spans(self, tokens: List[Span]) -> Iterator[Tuple[int, int]]:
+        """Token index windows [i, j) covering ``tokens``."""
+        i, n = 0, len(tokens)
+        while i < n:
+            j = min(i + self.chunk_tokens, n)
+            yield i, j
+            if j == n:
+                return
+            i = j - self.overlap_tokens
+
+    def chunk_text(self, text: str) -> Iterator[Span]:
+        """Character spans of the chunks of a single text."""
+        tokens = self.tokenizer.token_spans(text)
+        for i, j in self.spans(tokens):
+            yield tokens[i][0], tokens[j - 1][1]
+
+    def chunk_pages(self, pages: Iterable[Dict]) -> Iterator[Dict]:
+        """
+        Lazily yields chunk records for a stream of page records.
+
+        Holds at most two pages at a time: the one being chunked and, with
+        ``span_pages``, the next one to borrow its opening tokens from.
+        """
+        pages = iter(pages)
+        current = next(pages, None)
+        current_tokens = self.tokenizer.token_spans(current["text"]) if current else []
+        while current is not None:
+            following = next(pages, None) if self.span_pages else None
+            following_tokens = self.tokenizer.token_spans(following["text"]) if following else []
+            text = current["text"]
+            windows = list(self.spans(current_tokens))
+            for n, (i, j) in enumerate(windows):
+                start, end = current_tokens[i][0], current_tokens[j - 1][1]
+                chunk = text[start:end]
+                missing = self.chunk_tokens - (j - i)
+                if n == len(windows) - 1 and missing > 0 and following_tokens:
+                    borrowed = following_tokens[:missing]
+                    head_end = borrowed[-1][1]
+                    chunk = text[start:] + PAGE_SEPARATOR + following["text"][:head_end]
+                    end = len(text) + len(PAGE_SEPARATOR) + head_end
+                yield {
+                    "filename": current["filename"],
+                    "title": current.get("title", current["filename"]),
+                    "page_number": current["page_number"],
+                    "chunk_id": f"{current['page_number']}_{n + 1}",
+                    "start_char": start,
+                    "end_char": end,
+                    "text": chunk,
+                }
+            if not self.span_pages:
+                following = next(pages, None)
+                following_tokens = self.tokenizer.token_spans(following["text"]) if following else []
+            current, current_tokens = following, following_tokens
@@ -0,0 +1,106 @@
+import os
+import re
+from collections import namedtuple
+from typing import List, Optional
+
+from chat_context import CHARS_PER_TOKEN, count_tokens
+
+# ---------------- Settings ---------------- #
+CONTEXT_TOKENS = int(os.getenv("CONTEXT_TOKENS") or 1500)  # budget for retrieved context in a RAG prompt
+ADJACENT_GAP_CHARS = 2  # spans this close on a page (e.g. separated by a space) are joined
+NEAR_DUPLICATE = 0.9  # share of a span's word trigrams found in an already packed span
+SPAN_SEPARATOR = "\n\n"
+
+# ``distance`` is that of the best chunk in the span; ``chunks`` counts the chunks merged into it.
+ContextSpan = namedtuple("ContextSpan", ["filename", "page_number", "start_char", "end_char", "text", "distance", "chunks"])
+
+
+def _shingles(text: str) -> set:
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + 3]) for i in range(max(len(words) - 2, 1))}
+
+
+def truncate_text(text: str, max_tokens: int) -> str:
+    """``text`` cut at a word boundary to at most ``max_tokens`` estimated tokens."""
+    limit = max(max_tokens, 0) * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit + 1)
+    return text[:cut if cut > 0 else limit].rstrip()
+
+
+def merge_chunks(rows: List) -> List[ContextSpan]:
+    """
+    Merges retrieved chunks that overlap or touch on the same page into single spans.
+
+    Uses the chunks' ``start_char``/``end_char`` offsets; rows stored without
+    offsets become spans of their own. Spans are returned in document order.
+    """
+    spans = []
+    keyed = sorted(
+        (row for row in rows if getattr(row, "start_char", None) is not None),
+        key=lambda row: (row.filename, row.page_number, row.start_char, row.end_char),
+    )
+    for row in keyed:
+        last = spans[-1] if spans else None
+        if (last is not None and (last.filename, last.page_number) == (row.filename, row.page_number)
+                and row.start_char <= last.end_char + ADJACENT_GAP_CHARS):
+            if row.end_char > last.end_char:
+                if row.start_char <= last.end_char:
+                    text = last.text + row.text[last.end_char - row.start_char:]
+                else:
+                    text = last.text + " " + row.text
+            else:
+                text = last.text
+            spans[-1] = last._replace(end_char=max(last.end_char, row.end_char), text=text,
+                                      distance=min(last.distance, row.distance), chunks=last.chunks + 1)
+        else:
+            spans.append(ContextSpan(row.filename, row.page_number, row.start_char, row.end_char,
+                                     row.text, row.distance, 1))
+    spans += [
+        ContextSpan(row.filename, row.page_number, None, None, row.text, row.distance, 1)
+        for row in rows if getattr(row, "start_char", None) is None
+    ]
+    return spans
+
+
+def pack_context(rows: List, budget: Optional[int] = CONTEXT_TOKENS) -> List[ContextSpan]:
+    """
+    Turns search rows into the context for a prompt.
+
+    Overlapping and adjacent chunks are merged, near-duplicate spans dropped,
+    and the rest added best-first until ``budget`` tokens are used. A span
+    that doesn't fit is cut at a word boundary to the budget left, so the best
+    span is always included even when many hits merge into more text than the
+    whole budget. The packed spans are returned in document position order: documents in the order of
+    their best hit, then by page and offset.
+    """
+    packed, kept_shingles, used = [], [], 0
+    separator = count_tokens(SPAN_SEPARATOR)
+    for span in sorted(merge_chunks(rows), key=lambda span: span.distance):
+        shingles = _shingles(span.text)
+        if any(len(shingles & kept) >= NEAR_DUPLICATE * len(shingles) for kept in kept_shingles):
+            continue
+        cost = count_tokens(span.text) + separator
+        if budget is not None and used + cost > budget:
+            text = truncate_text(span.text, budget - used - separator)
+            if not text:
+                break
+            end_char = None if span.start_char is None else min(span.end_char, span.start_char + len(text))
+            span = span._replace(text=text, end_char=end_char)
+            cost = count_tokens(text) + separator
+        packed.append(span)
+        kept_shingles.append(shingles)
+        used += cost
+
+    document_rank = {}
+    for span in packed:
+        document_rank.setdefault(span.filename, len(document_rank))
+    return sorted(packed, key=lambda span: (
+        document_rank[span.filename], span.page_number,
+        span.start_char if span.start_char is not None else float("inf"),
+    ))
+
+
+def build_context(rows: List, budget: Optional[int] = CONTEXT_TOKENS) -> str:
+    return SPAN_SEPARATOR.join(span.text for span in pack_context(rows, budget))
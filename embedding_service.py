@@ -0,0 +1,210 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+# ---------------- Settings ---------------- #
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL") or "all-MiniLM-L6-v2"
+MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH") or 64)  # texts per forward pass
+MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS") or 5)  # how long a partial batch waits for company
+INTERACTIVE_MAX_TEXTS = 8  # requests this small (queries) are served before bulk ingestion
+# Seconds without requests before the model is unloaded to free memory; negative keeps it loaded.
+KEEP_ALIVE = float(os.getenv("EMBED_KEEP_ALIVE") or -1)
+
+
+class _Request:
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.parts: Dict[int, np.ndarray] = {}
+        self.remaining = len(texts)
+        self.future = Future()
+
+
+class EmbeddingService:
+    """
+    One embedding model per process, shared by every session and thread.
+
+    ``encode`` has the same calling convention as ``SentenceTransformer.encode``,
+    so the service can be passed anywhere an embedding model is expected.
+    Requests are not encoded one by one: a single worker thread coalesces
+    everything queued within ``max_wait_ms`` into batches of up to ``max_batch``
+    texts. Concurrent users therefore share forward passes. Small (query-sized)
+    requests go ahead of bulk ingestion slices, so a large upload doesn't stall
+    searches.
+
+    The model is loaded on first use, or ahead of it by ``warm_up``. With a
+    non-negative ``keep_alive`` a model the service loaded itself is unloaded
+    after that many idle seconds and loaded again by the next request;
+    ``stats`` reports how often that happened and how long the last load took.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, max_batch: int = MAX_BATCH,
+                 max_wait_ms: float = MAX_WAIT_MS, model=None, keep_alive: float = KEEP_ALIVE):
+        self.model_name = model_name
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.keep_alive = keep_alive
+        self._model = model
+        self._owns_model = model is None
+        self._model_lock = threading.Lock()
+        self._loads = 0
+        self._load_seconds = 0.0
+        self._last_used = time.monotonic()
+        self._interactive = deque()  # (request, offset, texts) slices
+        self._bulk = deque()
+        self._cond = threading.Condition()
+        self._batches = 0
+        self._texts = 0
+        self._worker = threading.Thread(target=self._run, name="embedding-service", daemon=True)
+        self._worker.start()
+
+    # ---------------- Model ---------------- #
+
+    @property
+    def model(self):
+        """The underlying SentenceTransformer, loaded on first use."""
+        model = self._model
+        if model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    start = time.perf_counter()
+                    self._model = SentenceTransformer(self.model_name)
+                    self._load_seconds = time.perf_counter() - start
+                    self._loads += 1
+                model = self._model
+        return model
+
+    def warm_up(self) -> float:
+        """Loads the model and runs one forward pass; returns the seconds it took."""
+        start = time.perf_counter()
+        self.encode("warm-up")
+        return time.perf_counter() - start
+
+    def _unload_if_idle(self):
+        # Called by the worker with the queues locked, so no request can be waiting on the model.
+        if self._owns_model and self.keep_alive >= 0 and self._model is not None \
+                and not (self._interactive or self._bulk) and time.monotonic() - self._last_used >= self.keep_alive:
+            with self._model_lock:
+                self._model = None
+
+    def _idle_timeout(self) -> Optional[float]:
+        if not self._owns_model or self.keep_alive < 0 or self._model is None:
+            return None
+        return max(self.keep_alive - (time.monotonic() - self._last_used), 0.01)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    # ---------------- Public API ---------------- #
+
+    def encode(self, sentences: Union[str, Sequence[str]], batch_size: Optional[int] = None,
+               convert_to_numpy: bool = True, normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        """
+        Embeds one string (1-D result) or a list of strings (2-D result).
+
+        ``batch_size`` is ignored, as batches are formed across requests, and the
+        result is always a numpy array. Other ``SentenceTransformer.encode``
+        options are not supported and raise TypeError instead of being ignored.
+        """
+        if kwargs:
+            raise TypeError(f"EmbeddingService.encode() does not support {', '.join(sorted(kwargs))}")
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        request = _Request(texts)
+        queue = self._interactive if len(texts) <= INTERACTIVE_MAX_TEXTS else self._bulk
+        with self._cond:
+            for offset in range(0, len(texts), self.max_batch):
+                queue.append((request, offset, texts[offset:offset + self.max_batch]))
+            self._cond.notify()
+        embeddings = request.future.result()
+        if normalize_embeddings:
+            embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings[0] if single else embeddings
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self._batches,
+            "texts": self._texts,
+            "avg_batch_size": self._texts / self._batches if self._batches else 0.0,
+            "queued_slices": len(self._interactive) + len(self._bulk),
+            "model_loaded": self._model is not None,
+            "model_loads": self._loads,
+            "load_seconds": self._load_seconds,
+        }
+
+    # ---------------- Worker ---------------- #
+
+    def _pending(self) -> int:
+        return sum(len(s[2]) for s in self._interactive) + sum(len(s[2]) for s in self._bulk)
+
+    def _take_batch(self) -> List[tuple]:
+        batch, size = [], 0
+        for queue in (self._interactive, self._bulk):
+            while queue and size + len(queue[0][2]) <= self.max_batch:
+                slice_ = queue.popleft()
+                batch.append(slice_)
+                size += len(slice_[2])
+        if not batch:  # a single slice never exceeds max_batch, but be safe
+            batch.append((self._interactive or self._bulk).popleft())
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not (self._interactive or self._bulk):
+                    self._cond.wait(self._idle_timeout())
+                    self._unload_if_idle()
+                # Give other sessions a moment to join a partial batch.
+                deadline = time.monotonic() + self.max_wait
+                while self._pending() < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._take_batch()
+
+            texts = [text for _, _, slice_texts in batch for text in slice_texts]
+            try:
+                embeddings = np.asarray(
+                    self.model.encode(texts, batch_size=len(texts), convert_to_numpy=True), dtype=np.float32
+                )
+            except Exception as e:
+                for request, _, _ in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                continue
+
+            self._batches += 1
+            self._texts += len(texts)
+            self._last_used = time.monotonic()
+            row = 0
+            for request, offset, slice_texts in batch:
+                if request.future.done():  # an earlier slice failed
+                    row += len(slice_texts)
+                    continue
+                request.parts[offset] = embeddings[row:row + len(slice_texts)]
+                row += len(slice_texts)
+                request.remaining -= len(slice_texts)
+                if request.remaining == 0:
+                    request.future.set_result(np.concatenate([request.parts[o] for o in sorted(request.parts)]))
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_embedding_service() -> EmbeddingService:
+    """The process-wide service; Streamlit reruns and sessions all get the same instance."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = EmbeddingService()
+        return _service
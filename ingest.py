@@ -0,0 +1,266 @@
+import os
+import time
+from collections import Counter
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import Column, Index, Integer, MetaData, Table, Text, delete, func, insert, select, text
+
+import manifest
+import term_stats
+import tracing
+from chunker import DEFAULT_CHUNK_TOKENS, DEFAULT_OVERLAP_TOKENS, Chunker, tokenizer_for
+from pdf_extractor import PdfSource, count_pages, extract_text_by_page, source_name
+
+# ---------------- Settings ---------------- #
+EMBEDDING_DIM = 384  # all-MiniLM-L6-v2
+DEFAULT_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE") or 64)
+
+metadata = MetaData()
+
+# Only the columns the ingestion path writes; the table itself is managed in PostgreSQL.
+pdf_chunks = Table(
+    "pdf_chunks",
+    metadata,
+    Column("filename", Text),
+    Column("page_number", Integer),
+    Column("chunk_id", Text),
+    Column("text", Text),
+    Column("start_char", Integer),  # chunk offsets into the page text, see chunker.Chunker
+    Column("end_char", Integer),
+    Column("embedding", Vector(EMBEDDING_DIM)),
+)
+
+# Lets incremental re-ingestion delete a document's stale pages without a full scan.
+pdf_chunks_page_idx = Index("pdf_chunks_filename_page_idx", pdf_chunks.c.filename, pdf_chunks.c.page_number)
+
+# ---------------- Functions ---------------- #
+
+def add_offset_columns(conn):
+    """Adds the chunk offset columns to a ``pdf_chunks`` table created before they existed."""
+    conn.execute(text(
+        "ALTER TABLE pdf_chunks ADD COLUMN IF NOT EXISTS start_char integer, "
+        "ADD COLUMN IF NOT EXISTS end_char integer"
+    ))
+
+
+def batched(items: Iterable, batch_size: int) -> Iterator[List]:
+    """Yield lists of up to ``batch_size`` items without materializing the input."""
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def embed_batch(embedding_model, batch: List[Dict], batch_size: int = DEFAULT_BATCH_SIZE):
+    """Embeddings for a batch of chunk records; records that already carry an ``embedding`` are not re-encoded."""
+    if all("embedding" in chunk for chunk in batch):
+        return [chunk["embedding"] for chunk in batch]
+    tracing.count("chunks_embedded", len(batch))
+    with tracing.span("embed"):
+        return embedding_model.encode(
+            [chunk["text"] for chunk in batch],
+            batch_size=batch_size,
+            convert_to_numpy=True,
+        )
+
+
+def write_chunks(conn, embedding_model, chunks: Iterable[Dict], batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Embeds ``chunks`` batch by batch and inserts each batch with one multi-row INSERT on ``conn``."""
+    count = 0
+    for batch in batched(chunks, batch_size):
+        embeddings = embed_batch(embedding_model, batch, batch_size)
+        with tracing.span("db_insert"):
+            conn.execute(insert(pdf_chunks), [
+                {
+                    "filename": chunk["filename"],
+                    "page_number": chunk["page_number"],
+                    "chunk_id": chunk["chunk_id"],
+                    "text": chunk["text"],
+                    "start_char": chunk.get("start_char"),
+                    "end_char": chunk.get("end_char"),
+                    "embedding": emb,
+                }
+                for chunk, emb in zip(batch, embeddings)
+            ])
+        count += len(batch)
+    return count
+
+
+def _stats(count: int, start: float, **extra) -> Dict:
+    elapsed = time.perf_counter() - start
+    return {
+        "chunks": count,
+        "seconds": elapsed,
+        "chunks_per_sec": count / elapsed if elapsed > 0 else 0.0,
+        **extra,
+    }
+
+
+def store_chunks(engine, embedding_model, chunks: Iterable[Dict], batch_size: int = DEFAULT_BATCH_SIZE) -> Dict:
+    """
+    Embeds chunks in batches and bulk inserts them into ``pdf_chunks``.
+
+    Every batch is encoded with a single forward pass and written with one
+    multi-row INSERT. All batches share one transaction, so a failure part way
+    through leaves the table untouched.
+
+    Args:
+        engine: SQLAlchemy engine connected to the pgvector database.
+        embedding_model: A SentenceTransformer (anything with ``encode``).
+        chunks (Iterable[dict]): Records with filename, page_number, chunk_id, text and
+            optionally start_char/end_char.
+        batch_size (int): Number of chunks per forward pass and per INSERT.
+
+    Returns:
+        dict: ``chunks`` written, ``seconds`` elapsed and ``chunks_per_sec``.
+    """
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        count = write_chunks(conn, embedding_model, chunks, batch_size)
+    return _stats(count, start)
+
+
+@tracing.traced("ingest_document")
+def ingest_document(store, embedding_model, source: PdfSource, filename: Optional[str] = None,
+                    chunk_size: int = DEFAULT_CHUNK_TOKENS, overlap: int = DEFAULT_OVERLAP_TOKENS,
+                    batch_size: int = DEFAULT_BATCH_SIZE,
+                    progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+    """
+    Incrementally ingests one PDF, using the manifest to skip work already done.
+
+    - Content already ingested with the same chunking (under any filename) is a no-op.
+    - A revision of a known filename re-embeds only pages whose text hash changed
+      and deletes the rows of changed or removed pages.
+    - Anything else replaces all rows stored under the filename.
+
+    ``chunk_size`` and ``overlap`` count tokens of the embedding model's own
+    tokenizer (see ``chunker.Chunker``); the chunk size is capped at what the
+    model reads. When chunks span page breaks, a changed page also re-embeds the
+    page before it, whose last chunk runs onto it.
+
+    Term statistics (see ``term_stats``) are counted in the same pass over the
+    page text and replace the document's previous counts. A skipped document
+    that has none yet (ingested before they were kept) gets them counted.
+
+    Chunk rows, the manifest and term statistics are updated in one transaction
+    on the store's engine; ``store`` is any ``vector_store.VectorStore``.
+    Extraction, chunking, embedding and inserts are timed as ``tracing`` stages.
+    ``progress``, if given, is called as ``progress(pages_done, page_count)``
+    while pages are processed.
+
+    Returns:
+        dict: ``store_chunks`` stats plus ``filename``, ``skipped``,
+        ``pages_embedded`` and ``pages_deleted``.
+    """
+    start = time.perf_counter()
+    if hasattr(source, "read") and not hasattr(source, "getbuffer"):
+        source = source.read()  # a plain stream can't be re-read for the second pass
+    filename = source_name(source, filename)
+    file_hash = manifest.hash_source(source)
+    chunker = Chunker(tokenizer_for(embedding_model), chunk_size, overlap)
+    chunk_size = chunker.chunk_tokens
+
+    with store.engine.begin() as conn:
+        store.lock_writes(conn)  # before the manifest says what is already stored
+        manifest.ensure_manifest(conn)
+        term_stats.ensure_term_tables(conn)
+        store.prepare(conn)
+
+        existing = manifest.find_document(conn, file_hash, chunk_size, overlap)
+        if existing is not None:
+            if not term_stats.has_document_terms(conn, existing):
+                # Ingested before term statistics were kept: count them once now.
+                term_counts = Counter()
+                for page in tracing.timed("extract_text_by_page", extract_text_by_page(source, existing)):
+                    term_counts.update(term_stats.extract_terms(page["text"]))
+                term_stats.record_document_terms(conn, existing, term_counts)
+            return _stats(0, start, filename=existing, skipped=True, pages_embedded=0, pages_deleted=0)
+
+        known = manifest.page_hashes(conn, filename, chunk_size, overlap)
+        hashes = {}
+        if known:
+            for page in tracing.timed("extract_text_by_page", extract_text_by_page(source, filename)):
+                hashes[page["page_number"]] = manifest.text_hash(page["text"])
+            affected = {p for p in set(known) | set(hashes) if known.get(p) != hashes.get(p)}
+            changed = {p for p in hashes if p in affected or (chunker.span_pages and p + 1 in affected)}
+            stale = sorted(p for p in known if p in affected or p in changed)
+            if stale:
+                store.delete_chunks(conn, filename, stale)
+        else:
+            # Also clears duplicates left by uploads that predate the manifest.
+            stale = []
+            changed = None
+            store.delete_chunks(conn, filename)
+
+        embedded_pages = []
+        term_counts = Counter()
+        page_count = count_pages(source) if progress else 0
+
+        def pages():
+            for page in extract_text_by_page(source, filename):
+                if progress:
+                    progress(page["page_number"] - 1, page_count)
+                if changed is None:
+                    hashes[page["page_number"]] = manifest.text_hash(page["text"])
+                term_counts.update(term_stats.extract_terms(page["text"]))
+                if changed is None or page["page_number"] in changed:
+                    embedded_pages.append(page["page_number"])
+                yield page
+
+        # Unchanged pages are still read: a changed page's last chunk may borrow the next page's opening.
+        records = (
+            chunk for chunk in tracing.timed(
+                "chunk_text", chunker.chunk_pages(tracing.timed("extract_text_by_page", pages())))
+            if changed is None or chunk["page_number"] in changed
+        )
+        count = store.write_chunks(conn, embedding_model, records, batch_size)
+        tracing.count("chunks_written", count)
+        if progress:
+            progress(page_count, page_count)
+        manifest.record_document(conn, filename, file_hash, chunk_size, overlap, hashes)
+        term_stats.record_document_terms(conn, filename, term_counts)
+        if count or stale or changed is None:
+            manifest.bump_corpus_version(conn)
+
+    store.after_ingest()
+    return _stats(count, start, filename=filename, skipped=False,
+                  pages_embedded=len(embedded_pages), pages_deleted=len(stale))
+
+
+def remove_document(store, filename: str):
+    """Deletes a document's chunks, manifest entry and term statistics."""
+    with store.engine.begin() as conn:
+        store.lock_writes(conn)
+        manifest.ensure_manifest(conn)
+        term_stats.ensure_term_tables(conn)
+        store.delete_chunks(conn, filename)
+        manifest.forget_document(conn, filename)
+        term_stats.forget_document_terms(conn, filename)
+        manifest.bump_corpus_version(conn)
+    store.after_ingest()
+
+
+def delete_chunks(conn, filename: str, pages: Optional[Iterable[int]] = None):
+    """Deletes a document's rows from ``pdf_chunks``, optionally only those of the given pages."""
+    condition = pdf_chunks.c.filename == filename
+    if pages is not None:
+        condition = condition & pdf_chunks.c.page_number.in_(list(pages))
+    conn.execute(delete(pdf_chunks).where(condition))
+
+
+def fetch_document_chunks(engine, filename: str) -> List:
+    """Returns the stored (page_number, chunk_id, text, start_char, end_char) rows of a document in reading order."""
+    sql = (
+        select(pdf_chunks.c.page_number, pdf_chunks.c.chunk_id, pdf_chunks.c.text,
+               pdf_chunks.c.start_char, pdf_chunks.c.end_char)
+        .where(pdf_chunks.c.filename == filename)
+        .order_by(pdf_chunks.c.page_number, func.length(pdf_chunks.c.chunk_id), pdf_chunks.c.chunk_id)
+    )
+    with engine.connect() as conn:
+        return list(conn.execute(sql))
@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+# ---------------- Settings ---------------- #
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS") or 1)
+MAX_FINISHED_JOBS = 100
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# ---------------- Jobs ---------------- #
+
+@dataclass
+class IngestJob:
+    """Status of one upload's ingestion, updated by the worker and read by the UI."""
+    key: str
+    filename: str
+    status: str = QUEUED
+    stage: str = ""
+    pages_done: int = 0
+    page_count: int = 0
+    result: Any = None
+    error: Optional[str] = None
+    submitted_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    @property
+    def progress(self) -> float:
+        if self.status == DONE:
+            return 1.0
+        if not self.page_count:
+            return 0.0
+        return min(self.pages_done / self.page_count, 1.0)
+
+    def update_progress(self, pages_done: int, page_count: int):
+        self.pages_done = pages_done
+        self.page_count = page_count
+
+
+class IngestJobManager:
+    """
+    Runs each ingestion job exactly once on a background thread pool.
+
+    Jobs are keyed by content (see ``job_key``), so submitting the same upload
+    again, from a rerun or another session, returns the existing job instead of
+    starting a new one. Failed jobs are only re-run when asked to with ``retry_failed``.
+    """
+
+    def __init__(self, max_workers: int = INGEST_WORKERS, max_finished: int = MAX_FINISHED_JOBS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs: Dict[str, IngestJob] = {}
+        self._lock = threading.Lock()
+        self._max_finished = max_finished
+
+    def submit(self, key: str, filename: str, fn: Callable[[IngestJob], Any], retry_failed: bool = False) -> IngestJob:
+        """Queues ``fn(job)`` unless a job with ``key`` already exists."""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and not (retry_failed and job.status == FAILED):
+                return job
+            job = IngestJob(key=key, filename=filename)
+            self._jobs[key] = job
+            self._evict_finished()
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def get(self, key: str) -> Optional[IngestJob]:
+        return self._jobs.get(key)
+
+    def jobs(self) -> List[IngestJob]:
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.submitted_at)
+
+    def _run(self, job: IngestJob, fn: Callable[[IngestJob], Any]):
+        job.status = RUNNING
+        try:
+            job.result = fn(job)
+            job.status = DONE
+        except Exception as e:
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+
+    def _evict_finished(self):
+        finished = [job for job in self._jobs.values() if job.done]
+        excess = len(finished) - self._max_finished
+        for job in sorted(finished, key=lambda job: job.finished_at or 0)[:max(excess, 0)]:
+            del self._jobs[job.key]
+
+
+def job_key(file_hash: str, *params) -> str:
+    """Identifies an ingestion by document content and the settings it was processed with."""
+    return ":".join([file_hash, *map(str, params)])
@@ -0,0 +1,145 @@
+import hashlib
+import os
+from typing import Dict, Optional
+
+from sqlalchemy import (
+    Column, DateTime, ForeignKey, Index, Integer, MetaData, String, Table, Text, delete, func, insert, select, update,
+)
+from sqlalchemy.exc import DBAPIError
+
+# ---------------- Settings ---------------- #
+HASH_BLOCK_SIZE = 1024 * 1024
+
+metadata = MetaData()
+
+# One row per ingested document. A document is identified by its filename; the
+# file hash and chunking parameters tell us whether the stored chunks are current.
+pdf_documents = Table(
+    "pdf_documents",
+    metadata,
+    Column("filename", Text, primary_key=True),
+    Column("file_hash", String(64), nullable=False, index=True),
+    Column("chunk_size", Integer, nullable=False),
+    Column("overlap", Integer, nullable=False),
+    Column("page_count", Integer, nullable=False),
+    Column("ingested_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+# Lets searches scoped by ingestion date (see search_scope) find their documents without a scan.
+pdf_documents_ingested_idx = Index("pdf_documents_ingested_at_idx", pdf_documents.c.ingested_at)
+
+# Hash of each page's extracted text, so a revision only re-embeds pages that changed.
+pdf_document_pages = Table(
+    "pdf_document_pages",
+    metadata,
+    Column("filename", Text, ForeignKey("pdf_documents.filename", ondelete="CASCADE"), primary_key=True),
+    Column("page_number", Integer, primary_key=True),
+    Column("text_hash", String(64), nullable=False),
+)
+
+# A single counter bumped by every write to the chunk store, so caches of
+# search results can tell whether they are still current.
+pdf_corpus_version = Table(
+    "pdf_corpus_version",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=False),
+    Column("version", Integer, nullable=False),
+)
+
+# ---------------- Functions ---------------- #
+
+def ensure_manifest(conn):
+    """Creates the manifest tables if they don't exist yet."""
+    metadata.create_all(conn, checkfirst=True)
+    pdf_documents_ingested_idx.create(conn, checkfirst=True)  # tables created before the index existed
+
+
+def hash_bytes(data) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_source(source) -> str:
+    """SHA-256 of a PDF given as a path, bytes-like object or in-memory file."""
+    if isinstance(source, (str, os.PathLike)):
+        return hash_file(source)
+    if hasattr(source, "getbuffer"):
+        return hash_bytes(source.getbuffer())
+    return hash_bytes(source)
+
+
+def text_hash(text: str) -> str:
+    return hash_bytes(text.encode("utf-8"))
+
+
+def find_document(conn, file_hash: str, chunk_size: int, overlap: int) -> Optional[str]:
+    """Returns the filename of a document already ingested with this content and chunking, if any."""
+    return conn.execute(
+        select(pdf_documents.c.filename).where(
+            pdf_documents.c.file_hash == file_hash,
+            pdf_documents.c.chunk_size == chunk_size,
+            pdf_documents.c.overlap == overlap,
+        ).limit(1)
+    ).scalar()
+
+
+def page_hashes(conn, filename: str, chunk_size: int, overlap: int) -> Dict[int, str]:
+    """
+    Returns {page_number: text_hash} for a previously ingested document.
+
+    An empty dict means the stored chunks can't be reused: the document is new
+    or was chunked with different settings.
+    """
+    document = conn.execute(
+        select(pdf_documents.c.chunk_size, pdf_documents.c.overlap).where(pdf_documents.c.filename == filename)
+    ).first()
+    if document is None or (document.chunk_size, document.overlap) != (chunk_size, overlap):
+        return {}
+    rows = conn.execute(
+        select(pdf_document_pages.c.page_number, pdf_document_pages.c.text_hash)
+        .where(pdf_document_pages.c.filename == filename)
+    )
+    return {row.page_number: row.text_hash for row in rows}
+
+
+def record_document(conn, filename: str, file_hash: str, chunk_size: int, overlap: int, hashes: Dict[int, str]):
+    """Replaces the manifest entry for ``filename`` with the given file and page hashes."""
+    forget_document(conn, filename)
+    conn.execute(insert(pdf_documents), {
+        "filename": filename,
+        "file_hash": file_hash,
+        "chunk_size": chunk_size,
+        "overlap": overlap,
+        "page_count": len(hashes),
+    })
+    if hashes:
+        conn.execute(insert(pdf_document_pages), [
+            {"filename": filename, "page_number": page_number, "text_hash": h}
+            for page_number, h in sorted(hashes.items())
+        ])
+
+
+def forget_document(conn, filename: str):
+    conn.execute(delete(pdf_document_pages).where(pdf_document_pages.c.filename == filename))
+    conn.execute(delete(pdf_documents).where(pdf_documents.c.filename == filename))
+
+
+def corpus_version(conn) -> int:
+    """The current corpus version; 0 before anything has been ingested."""
+    try:
+        return conn.execute(select(pdf_corpus_version.c.version)).scalar() or 0
+    except DBAPIError:  # manifest tables not created yet
+        return 0
+
+
+def bump_corpus_version(conn):
+    """Marks the chunk store as changed; call inside the transaction that changed it."""
+    if conn.execute(update(pdf_corpus_version).values(version=pdf_corpus_version.c.version + 1)).rowcount == 0:
+        conn.execute(insert(pdf_corpus_version), {"id": 1, "version": 1})
@@ -0,0 +1,86 @@
+"""
+Reports recall@k of the configured search against exact search.
+
+    VECTOR_STORE=numpy VECTOR_QUANTIZATION=int8 python measure_recall.py --k 10 --queries 200
+
+Queries are read from ``--queries-file`` (one per line) or, by default, made
+from the opening words of randomly sampled stored chunks. For every query the
+normal search (ANN index and/or quantized codes with re-ranking) is compared
+with ``exact=True`` search; recall@k is the share of exact top-k chunks it also
+returned. A JSON summary is printed to stdout.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from embedding_service import get_embedding_service
+from ingest import EMBEDDING_DIM
+from quantization import VECTOR_QUANTIZATION, code_dtype, code_width
+from stats import percentile
+from vector_store import VECTOR_STORE, open_store
+
+
+def chunk_key(row):
+    return row.filename, row.page_number, row.chunk_id
+
+
+def bytes_per_vector(quantization: str, dim: int = EMBEDDING_DIM) -> int:
+    if quantization == "none":
+        return dim * 4
+    return code_width(quantization, dim) * np.dtype(code_dtype(quantization)).itemsize
+
+
+def measure_recall(store, embedding_model, queries, k: int = 10, **knobs):
+    recalls, exact_times, approx_times = [], [], []
+    for query_emb in embedding_model.encode(queries):
+        start = time.perf_counter()
+        exact = store.search(query_emb, k, exact=True)
+        exact_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        approx = store.search(query_emb, k, **knobs)
+        approx_times.append(time.perf_counter() - start)
+        if exact:
+            found = {chunk_key(row) for row in approx}
+            recalls.append(sum(chunk_key(row) in found for row in exact) / len(exact))
+    return {
+        "queries": len(recalls),
+        "k": k,
+        f"recall_at_{k}": round(float(np.mean(recalls)), 4) if recalls else None,
+        "exact_ms_p50": round(percentile(exact_times, 50) * 1000, 3),
+        "search_ms_p50": round(percentile(approx_times, 50) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure recall@k of the vector search against exact search.")
+    parser.add_argument("--store", choices=["pgvector", "numpy"], default=VECTOR_STORE)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100, help="number of sampled queries")
+    parser.add_argument("--queries-file", help="text file with one query per line")
+    parser.add_argument("--words", type=int, default=12, help="words of each sampled chunk used as its query")
+    parser.add_argument("--ef-search", type=int)
+    parser.add_argument("--probes", type=int)
+    args = parser.parse_args()
+
+    store = open_store(args.store)
+    if args.queries_file:
+        with open(args.queries_file, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = [" ".join(text.split()[:args.words]) for text in store.sample_texts(args.queries)]
+
+    summary = measure_recall(store, get_embedding_service(), queries, args.k,
+                             ef_search=args.ef_search, probes=args.probes)
+    summary.update({
+        "store": args.store,
+        "quantization": VECTOR_QUANTIZATION,
+        "bytes_per_vector": bytes_per_vector(VECTOR_QUANTIZATION),
+        "float32_bytes_per_vector": bytes_per_vector("none"),
+    })
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
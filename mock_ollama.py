@@ -0,0 +1,203 @@
+"""
+A stand-in Ollama server for benchmarks and local testing.
+
+    python mock_ollama.py --port 11434 --tokens-per-sec 40 --latency 0.2
+
+Serves ``/api/chat`` (streamed or not), ``/api/generate`` and
+``/api/version`` with Ollama's response shapes, including the
+``load_duration``/``eval_duration`` fields. Every reply waits ``latency``
+seconds before its first token and then emits ``reply_tokens`` tokens at
+``tokens_per_sec``. The first request for a model also waits ``load_seconds``,
+like a cold model load, as does the first one after ``keep_alive`` expired.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ---------------- Settings ---------------- #
+DEFAULT_TOKENS_PER_SEC = 50.0
+DEFAULT_LATENCY = 0.05  # seconds before the first token
+DEFAULT_LOAD_SECONDS = 1.0
+DEFAULT_REPLY_TOKENS = 40
+WORDS = ("the", "union", "army", "congress", "war", "states", "president", "history", "of", "and")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # clients dropping keep-alive connections are expected
+
+
+class MockOllamaServer:
+    """Runs the mock on a background thread; ``url`` is its base URL (port 0 picks a free port)."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, tokens_per_sec: float = DEFAULT_TOKENS_PER_SEC,
+                 latency: float = DEFAULT_LATENCY, load_seconds: float = DEFAULT_LOAD_SECONDS,
+                 reply_tokens: int = DEFAULT_REPLY_TOKENS):
+        self.tokens_per_sec = tokens_per_sec
+        self.latency = latency
+        self.load_seconds = load_seconds
+        self.reply_tokens = reply_tokens
+        self.requests = 0
+        self._loaded_until = {}  # model -> monotonic time it stays loaded until (None: forever)
+        self._lock = threading.Lock()
+        self._httpd = _Server((host, port), self._handler())
+        self.url = f"http://{host}:{self._httpd.server_address[1]}"
+        self._thread = None
+
+    def start(self) -> "MockOllamaServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ---------------- Model ---------------- #
+
+    def _load(self, model: str, keep_alive) -> float:
+        """Seconds spent loading ``model`` for this request (0 if it is still loaded)."""
+        with self._lock:
+            self.requests += 1
+            now = time.monotonic()
+            loaded_until = self._loaded_until.get(model, 0.0)
+            cold = loaded_until is not None and loaded_until <= now
+            seconds = _seconds(keep_alive)
+            self._loaded_until[model] = None if seconds < 0 else now + self.load_seconds * cold + seconds
+        if cold:
+            time.sleep(self.load_seconds)
+        return self.load_seconds if cold else 0.0
+
+    def _tokens(self, seed: int):
+        for i in range(self.reply_tokens):
+            yield WORDS[(seed + i) % len(WORDS)] + " "
+
+    # ---------------- HTTP ---------------- #
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, body: dict):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _write_chunk(self, body: dict):
+                data = json.dumps(body).encode("utf-8") + b"\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def do_GET(self):
+                if self.path == "/api/version":
+                    self._send_json({"version": "mock"})
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                if self.path not in ("/api/chat", "/api/generate"):
+                    self.send_error(404)
+                    return
+                start = time.perf_counter()
+                model = payload.get("model", "mock")
+                load = server._load(model, payload.get("keep_alive", "5m"))
+                chat = self.path == "/api/chat"
+                if not chat and not payload.get("prompt"):
+                    # Ollama loads the model and returns at once for a generate without a prompt.
+                    self._send_json({"model": model, "response": "", "done": True,
+                                     **_durations(start, load, 0.0, 0)})
+                    return
+                time.sleep(server.latency)
+                prompt_eval = time.perf_counter() - start - load
+                seed = server.requests
+                if not payload.get("stream", True):
+                    tokens = list(server._tokens(seed))
+                    time.sleep(len(tokens) / server.tokens_per_sec)
+                    eval_s = time.perf_counter() - start - load - prompt_eval
+                    text = "".join(tokens)
+                    body = {"message": {"role": "assistant", "content": text}} if chat else {"response": text}
+                    self._send_json({"model": model, **body, "done": True,
+                                     **_durations(start, load, prompt_eval, len(tokens), eval_s)})
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                count = 0
+                for token in server._tokens(seed):
+                    body = {"message": {"role": "assistant", "content": token}} if chat else {"response": token}
+                    self._write_chunk({"model": model, **body, "done": False})
+                    count += 1
+                    time.sleep(1 / server.tokens_per_sec)
+                eval_s = time.perf_counter() - start - load - prompt_eval
+                body = {"message": {"role": "assistant", "content": ""}} if chat else {"response": ""}
+                self._write_chunk({"model": model, **body, "done": True,
+                                   **_durations(start, load, prompt_eval, count, eval_s)})
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+
+def _seconds(keep_alive) -> float:
+    """Seconds of an Ollama keep_alive value: a number or a duration such as "30m"."""
+    if isinstance(keep_alive, (int, float)):
+        return float(keep_alive)
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    for unit in sorted(units, key=len, reverse=True):
+        if keep_alive.endswith(unit):
+            return float(keep_alive[:-len(unit)]) * units[unit]
+    return float(keep_alive)
+
+
+def _durations(start: float, load: float, prompt_eval: float, tokens: int, eval_s: float = 0.0) -> dict:
+    ns = 1_000_000_000
+    return {
+        "total_duration": int((time.perf_counter() - start) * ns),
+        "load_duration": int(load * ns),
+        "prompt_eval_duration": int(prompt_eval * ns),
+        "eval_count": tokens,
+        "eval_duration": int(eval_s * ns),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a mock Ollama API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--tokens-per-sec", type=float, default=DEFAULT_TOKENS_PER_SEC)
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY, help="seconds before the first token")
+    parser.add_argument("--load-seconds", type=float, default=DEFAULT_LOAD_SECONDS, help="simulated cold model load")
+    parser.add_argument("--reply-tokens", type=int, default=DEFAULT_REPLY_TOKENS)
+    args = parser.parse_args()
+
+    server = MockOllamaServer(args.host, args.port, args.tokens_per_sec, args.latency, args.load_seconds,
+                              args.reply_tokens)
+    print(f"Mock Ollama listening on {server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
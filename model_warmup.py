@@ -0,0 +1,70 @@
+"""
+Preloads the chat and embedding models, so the first question after a start
+(or after Ollama unloaded an idle model) doesn't pay their load time.
+
+    python model_warmup.py
+
+The Streamlit apps start the warm-up in the background once per server
+process; the command above does the same from a start script, e.g. before
+opening the apps to traffic. ``MODEL_WARMUP=0`` turns the apps' warm-up off.
+"""
+import json
+import os
+import sys
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict
+
+import requests
+
+from embedding_service import get_embedding_service
+from ollama_client import get_client
+
+# ---------------- Settings ---------------- #
+MODEL_WARMUP = (os.getenv("MODEL_WARMUP") or "1") not in ("0", "false", "no")
+
+_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="warm-up")  # warm_up plus one per model
+
+
+def warm_up_chat(client=None) -> Dict:
+    """Loads the chat model into Ollama with the configured keep-alive; ``load_s`` is Ollama's load time."""
+    client = client or get_client()
+    start = time.perf_counter()
+    try:
+        load = client.load_model()
+        return {"model": client.model, "load_s": round(load, 3), "seconds": round(time.perf_counter() - start, 3)}
+    except requests.exceptions.RequestException as e:
+        return {"model": client.model, "error": str(e), "seconds": round(time.perf_counter() - start, 3)}
+
+
+def warm_up_embeddings(service=None) -> Dict:
+    """Loads the embedding model and runs its first forward pass."""
+    service = service or get_embedding_service()
+    try:
+        seconds = service.warm_up()
+        return {"model": service.model_name, "load_s": round(service.stats()["load_seconds"], 3),
+                "seconds": round(seconds, 3)}
+    except Exception as e:
+        return {"model": service.model_name, "error": str(e)}
+
+
+def warm_up() -> Dict:
+    """Warms both models concurrently and returns their timings."""
+    chat = _executor.submit(warm_up_chat)
+    embeddings = _executor.submit(warm_up_embeddings)
+    return {"chat": chat.result(), "embeddings": embeddings.result()}
+
+
+def start_warm_up() -> Future:
+    """Starts ``warm_up`` in the background (unless MODEL_WARMUP is off) and returns its future."""
+    if not MODEL_WARMUP:
+        future = Future()
+        future.set_result({})
+        return future
+    return _executor.submit(warm_up)
+
+
+if __name__ == "__main__":
+    result = warm_up()
+    print(json.dumps(result))
+    sys.exit(1 if any("error" in part for part in result.values()) else 0)
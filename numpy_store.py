@@ -0,0 +1,474 @@
+import os
+from collections import namedtuple
+from contextlib import ExitStack
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import Column, Index, Integer, MetaData, Table, Text, create_engine, func, insert, select, update
+
+import tracing
+from ingest import batched, embed_batch
+from quantization import (
+    QUANTIZATIONS, RERANK_FACTOR, VECTOR_QUANTIZATION, block_distances, check_quantization, code_dtype, code_width,
+    encode, int8_scale,
+)
+from search_scope import SearchScope, scope_condition
+from vector_store import VectorStore
+
+# ---------------- Settings ---------------- #
+SEARCH_BLOCK_ROWS = 65536  # rows per matrix product, bounds temporary memory during search
+COMPACT_DELETED_FRACTION = 0.25
+WRITE_LOCK_TIMEOUT = float(os.getenv("VECTOR_STORE_LOCK_TIMEOUT") or 600)  # seconds a writer waits for another
+
+ChunkRow = namedtuple("ChunkRow", ["filename", "page_number", "chunk_id", "text", "start_char", "end_char", "distance"])
+
+metadata = MetaData()
+
+# Row ``row`` of the embedding matrix belongs to the chunk with the same ``row``.
+chunks = Table(
+    "chunks",
+    metadata,
+    Column("row", Integer, primary_key=True, autoincrement=False),
+    Column("filename", Text, nullable=False, index=True),
+    Column("page_number", Integer, nullable=False),
+    Column("chunk_id", Text, nullable=False),
+    Column("text", Text, nullable=False),
+    Column("start_char", Integer),
+    Column("end_char", Integer),
+    Column("deleted", Integer, nullable=False, default=0),
+)
+
+# Serves scoped searches (see search_scope) and per-page deletes.
+chunks_page_idx = Index("chunks_filename_page_idx", chunks.c.filename, chunks.c.page_number)
+
+# ``rows``: committed matrix rows, ``dim``: embedding size, ``version``: bumped on every change,
+# ``generation``: which set of matrix files holds the rows (see ``NumpyVectorStore.compact``).
+store_meta = Table(
+    "store_meta",
+    metadata,
+    Column("key", Text, primary_key=True),
+    Column("value", Integer, nullable=False),
+)
+
+# Old row -> new row, filled by ``compact`` to renumber the chunks in one statement.
+compact_rows = Table(
+    "compact_rows",
+    MetaData(),
+    Column("old_row", Integer, primary_key=True, autoincrement=False),
+    Column("new_row", Integer, nullable=False),
+    prefixes=["TEMPORARY"],
+)
+
+# ---------------- Store ---------------- #
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-process vector store: a memory-mapped float32 matrix plus SQLite metadata.
+
+    The directory holds ``embeddings.f32`` (one row per chunk), ``norms.f32``
+    (squared row norms, so L2 search is one matrix product) and ``store.db``
+    with chunk metadata and the ingestion manifest. Deleted chunks are
+    tombstoned and squeezed out by ``compact``.
+
+    With a ``quantization`` other than ``none``, compact codes are kept in
+    ``embeddings.<quantization>`` alongside. Searches scan the codes for
+    ``RERANK_FACTOR`` times ``top_k`` candidates and re-rank only those rows
+    with exact float32 distances. So the memory a search touches per chunk
+    shrinks 2x (half), 4x (int8) or 32x (binary). ``exact=True`` always scans
+    the float32 matrix.
+
+    Any number of processes can open the store with ``read_only=True`` and share
+    the page cache of the mapped files. Writers, in any process, take SQLite's
+    write lock (``lock_writes``) before reading the manifest or the row count
+    and hold it until their transaction commits, so they decide what to write
+    and append one after another (waiting up to ``WRITE_LOCK_TIMEOUT``). Rows appended by a write that never committed are
+    ignored by readers and truncated by the next write.
+    """
+    name = "the local vector store"
+
+    def __init__(self, path: str, read_only: bool = False, quantization: str = VECTOR_QUANTIZATION):
+        self.path = path
+        self.read_only = read_only
+        self.quantization = check_quantization(quantization)
+        if not read_only:
+            os.makedirs(path, exist_ok=True)
+        self.scale_path = os.path.join(path, "int8_scale.f32")
+        db_path = os.path.join(path, "store.db")
+        if read_only:
+            self.engine = create_engine(f"sqlite:///file:{db_path}?mode=ro&uri=true",
+                                        connect_args={"check_same_thread": False})
+        else:
+            self.engine = create_engine(f"sqlite:///{db_path}",
+                                        connect_args={"check_same_thread": False, "timeout": WRITE_LOCK_TIMEOUT})
+            metadata.create_all(self.engine)
+            self._add_offset_columns()
+            chunks_page_idx.create(self.engine, checkfirst=True)  # stores created before the index
+        self._cache_version = None
+        self._cache = None
+        if not read_only and self.quantization != "none":
+            with self.engine.begin() as conn:
+                self.lock_writes(conn)
+                meta = self._meta(conn)
+                self._ensure_codes(meta.get("rows", 0), meta.get("dim"), meta.get("generation", 0))
+
+    def _paths(self, generation: int):
+        """(embeddings, norms, codes or None) files of a generation; generation 0 keeps the original names."""
+        def path(name):
+            return os.path.join(self.path, f"{name}.{generation}" if generation else name)
+        codes = path(f"embeddings.{self.quantization}") if self.quantization != "none" else None
+        return path("embeddings.f32"), path("norms.f32"), codes
+
+    # ---------------- Metadata ---------------- #
+
+    def _add_offset_columns(self):
+        # Stores created before chunks carried character offsets.
+        with self.engine.begin() as conn:
+            columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(chunks)")}
+            for column in ("start_char", "end_char"):
+                if column not in columns:
+                    conn.exec_driver_sql(f"ALTER TABLE chunks ADD COLUMN {column} INTEGER")
+
+    def _meta(self, conn) -> Dict[str, int]:
+        return {row.key: row.value for row in conn.execute(select(store_meta))}
+
+    def _set_meta(self, conn, **values):
+        for key, value in values.items():
+            if conn.execute(update(store_meta).where(store_meta.c.key == key).values(value=value)).rowcount == 0:
+                conn.execute(insert(store_meta), {"key": key, "value": value})
+
+    def _bump_version(self, conn, **values):
+        self._set_meta(conn, version=self._meta(conn).get("version", 0) + 1, **values)
+
+    def lock_writes(self, conn):
+        """Takes SQLite's write lock, held until ``conn``'s transaction ends."""
+        conn.execute(update(store_meta).where(store_meta.c.key == "version").values(value=store_meta.c.value))
+
+    # ---------------- Writes ---------------- #
+
+    def prepare(self, conn):
+        metadata.create_all(conn, checkfirst=True)
+
+    def delete_chunks(self, conn, filename, pages=None):
+        condition = (chunks.c.filename == filename) & (chunks.c.deleted == 0)
+        if pages is not None:
+            condition = condition & chunks.c.page_number.in_(list(pages))
+        if conn.execute(update(chunks).where(condition).values(deleted=1)).rowcount:
+            self._bump_version(conn)
+
+    def write_chunks(self, conn, embedding_model, chunk_records: Iterable[Dict], batch_size: int) -> int:
+        """Appends embeddings to the matrix files and their metadata rows to SQLite on ``conn``."""
+        if self.read_only:
+            raise RuntimeError("store was opened read-only")
+        # Nothing below may read the row count or touch the files before this; see the class docstring.
+        self.lock_writes(conn)
+        meta = self._meta(conn)
+        rows, dim, generation = meta.get("rows", 0), meta.get("dim"), meta.get("generation", 0)
+        self._truncate(rows, dim, generation)
+        self._drop_stale_codes(generation)
+        self._ensure_codes(rows, dim, generation)
+        embeddings_path, norms_path, codes_path = self._paths(generation)
+        count = 0
+        with ExitStack() as files:
+            emb_file = files.enter_context(open(embeddings_path, "ab"))
+            norm_file = files.enter_context(open(norms_path, "ab"))
+            codes_file = files.enter_context(open(codes_path, "ab")) if codes_path else None
+            for batch in batched(chunk_records, batch_size):
+                embeddings = np.ascontiguousarray(embed_batch(embedding_model, batch, batch_size), dtype=np.float32)
+                if dim is None:
+                    dim = embeddings.shape[1]
+                elif embeddings.shape[1] != dim:
+                    raise ValueError(f"embedding size {embeddings.shape[1]} does not match store size {dim}")
+                with tracing.span("db_insert"):
+                    emb_file.write(embeddings.tobytes())
+                    norm_file.write(np.einsum("ij,ij->i", embeddings, embeddings).astype(np.float32).tobytes())
+                    if codes_file is not None:
+                        codes_file.write(encode(embeddings, self.quantization, self._scale(embeddings)).tobytes())
+                    conn.execute(insert(chunks), [
+                        {
+                            "row": rows + count + i,
+                            "filename": chunk["filename"],
+                            "page_number": chunk["page_number"],
+                            "chunk_id": chunk["chunk_id"],
+                            "text": chunk["text"],
+                            "start_char": chunk.get("start_char"),
+                            "end_char": chunk.get("end_char"),
+                        }
+                        for i, chunk in enumerate(batch)
+                    ])
+                count += len(batch)
+            for f in (emb_file, norm_file, codes_file):
+                if f is not None:
+                    f.flush()
+                    os.fsync(f.fileno())
+        if count:
+            self._bump_version(conn, rows=rows + count, dim=dim)
+        return count
+
+    def _code_bytes(self, dim: int) -> int:
+        return code_width(self.quantization, dim) * np.dtype(code_dtype(self.quantization)).itemsize
+
+    def _scale(self, embeddings: Optional[np.ndarray] = None) -> Optional[float]:
+        """The int8 scale, chosen from ``embeddings`` and saved on first use."""
+        if self.quantization != "int8":
+            return None
+        if os.path.exists(self.scale_path):
+            return float(np.fromfile(self.scale_path, dtype=np.float32)[0])
+        if embeddings is None:
+            return None
+        scale = int8_scale(embeddings)
+        np.array([scale], dtype=np.float32).tofile(self.scale_path)
+        return float(np.float32(scale))
+
+    def _truncate(self, rows: int, dim: Optional[int], generation: int):
+        # Drop rows left behind by a write whose transaction never committed.
+        embeddings_path, norms_path, codes_path = self._paths(generation)
+        files = [(embeddings_path, (dim or 0) * 4), (norms_path, 4)]
+        if codes_path:
+            files.append((codes_path, self._code_bytes(dim or 0)))
+        for path, row_bytes in files:
+            if os.path.exists(path) and os.path.getsize(path) > rows * row_bytes:
+                os.truncate(path, rows * row_bytes)
+
+    def _drop_stale_codes(self, generation: int):
+        # Codes of other quantizations would no longer line up with the rows after this write.
+        for kind in QUANTIZATIONS:
+            path = os.path.join(self.path, f"embeddings.{kind}" + (f".{generation}" if generation else ""))
+            if kind not in ("none", self.quantization) and os.path.exists(path):
+                os.remove(path)
+
+    def _ensure_codes(self, rows: int, dim: Optional[int], generation: int):
+        """Encodes rows that have no codes yet, e.g. after switching quantization on an existing store."""
+        embeddings_path, _, codes_path = self._paths(generation)
+        if not codes_path or not rows:
+            return
+        row_bytes = self._code_bytes(dim)
+        done = os.path.getsize(codes_path) // row_bytes if os.path.exists(codes_path) else 0
+        if done >= rows:
+            return
+        embeddings = np.memmap(embeddings_path, dtype=np.float32, mode="r", shape=(rows, dim))
+        with open(codes_path, "ab") as f:
+            f.truncate(done * row_bytes)
+            for start in range(done, rows, SEARCH_BLOCK_ROWS):
+                block = np.asarray(embeddings[start:start + SEARCH_BLOCK_ROWS])
+                f.write(encode(block, self.quantization, self._scale(block)).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        del embeddings
+
+    def after_ingest(self):
+        with self.engine.connect() as conn:
+            meta = self._meta(conn)
+            deleted = conn.execute(select(func.count()).where(chunks.c.deleted == 1)).scalar()
+        if meta.get("rows") and deleted / meta["rows"] > COMPACT_DELETED_FRACTION:
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrites the matrix without tombstoned rows and renumbers the metadata.
+
+        The compacted files are written under the next generation's names and
+        the metadata switches to them in the same commit, so readers, and a
+        store whose compaction failed or was killed, see either the old layout
+        or the new one. The old files are removed after the commit; readers that
+        still map them keep them alive until they refresh.
+        """
+        new_files, old_files = [], []
+        try:
+            with self.engine.begin() as conn:
+                self.lock_writes(conn)
+                meta = self._meta(conn)
+                rows, dim, generation = meta.get("rows", 0), meta.get("dim"), meta.get("generation", 0)
+                if not rows:
+                    return
+                live = np.array(conn.execute(
+                    select(chunks.c.row).where(chunks.c.deleted == 0, chunks.c.row < rows).order_by(chunks.c.row)
+                ).scalars().all(), dtype=np.int64)
+                self._drop_stale_codes(generation)
+                self._ensure_codes(rows, dim, generation)
+                embeddings_path, norms_path, codes_path = self._paths(generation)
+                sources = [
+                    (embeddings_path, np.memmap(embeddings_path, dtype=np.float32, mode="r", shape=(rows, dim))),
+                    (norms_path, np.memmap(norms_path, dtype=np.float32, mode="r", shape=(rows,))),
+                ]
+                if codes_path:
+                    sources.append((codes_path, self._codes(rows, dim, generation)))
+                for (old_path, data), new_path in zip(sources, self._paths(generation + 1)):
+                    new_files.append(new_path)
+                    with open(new_path, "wb") as f:
+                        for start in range(0, len(live), SEARCH_BLOCK_ROWS):
+                            f.write(np.ascontiguousarray(data[live[start:start + SEARCH_BLOCK_ROWS]]).tobytes())
+                        f.flush()
+                        os.fsync(f.fileno())
+                    old_files.append(old_path)
+                del sources, data
+
+                conn.execute(chunks.delete().where(chunks.c.deleted == 1))
+                if len(live):  # otherwise every row was tombstoned and the next generation is empty
+                    compact_rows.create(conn)
+                    conn.execute(insert(compact_rows), [
+                        {"old_row": old_row, "new_row": new_row} for new_row, old_row in enumerate(live.tolist())
+                    ])
+                    # Two passes keep the primary key unique while rows move down.
+                    conn.execute(update(chunks).values(row=-chunks.c.row - 1))
+                    conn.execute(update(chunks).values(row=compact_rows.c.new_row)
+                                 .where(chunks.c.row == -compact_rows.c.old_row - 1))
+                    compact_rows.drop(conn)
+                self._bump_version(conn, rows=len(live), generation=generation + 1)
+        except BaseException:
+            old_files = new_files  # the old generation stays current
+            raise
+        finally:
+            for path in old_files:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass  # e.g. still mapped on Windows; never read again
+
+    # ---------------- Reads ---------------- #
+
+    def _codes(self, rows: int, dim: int, generation: int) -> Optional[np.memmap]:
+        """The compact codes of the first ``rows`` rows, or None if they haven't been written (yet)."""
+        codes_path = self._paths(generation)[2]
+        if not codes_path or not os.path.exists(codes_path):
+            return None
+        width = code_width(self.quantization, dim)
+        if os.path.getsize(codes_path) < rows * self._code_bytes(dim):
+            return None
+        return np.memmap(codes_path, dtype=code_dtype(self.quantization), mode="r", shape=(rows, width))
+
+    def _snapshot(self, attempts: int = 3):
+        """Memory maps and tombstones for the committed rows, refreshed when the version changes."""
+        with self.engine.connect() as conn:
+            meta = self._meta(conn)
+            version = meta.get("version", 0)
+            if self._cache_version == version and self._cache is not None:
+                return self._cache
+            rows, dim, generation = meta.get("rows", 0), meta.get("dim"), meta.get("generation", 0)
+            deleted = np.array(conn.execute(
+                select(chunks.c.row).where(chunks.c.deleted == 1).order_by(chunks.c.row)
+            ).scalars().all(), dtype=np.int64)
+        embeddings = norms = codes = None
+        if rows:
+            embeddings_path, norms_path, _ = self._paths(generation)
+            try:
+                embeddings = np.memmap(embeddings_path, dtype=np.float32, mode="r", shape=(rows, dim))
+                norms = np.memmap(norms_path, dtype=np.float32, mode="r", shape=(rows,))
+            except FileNotFoundError:
+                if attempts <= 1:
+                    raise
+                return self._snapshot(attempts - 1)  # a compaction committed in between; read its metadata
+            codes = self._codes(rows, dim, generation)
+        self._cache = (rows, embeddings, norms, deleted, codes, self._scale())
+        self._cache_version = version
+        return self._cache
+
+    def _scoped_rows(self, scope: SearchScope, rows: int) -> np.ndarray:
+        """Matrix rows inside ``scope``, in ascending order, looked up through the metadata indexes."""
+        with self.engine.connect() as conn:
+            return np.array(conn.execute(
+                select(chunks.c.row)
+                .where(scope_condition(chunks, scope), chunks.c.deleted == 0, chunks.c.row < rows)
+                .order_by(chunks.c.row)
+            ).scalars().all(), dtype=np.int64)
+
+    def search_many(self, query_embs, top_k: int = 5, exact: bool = False,
+                    scope: Optional[SearchScope] = None) -> List[List[ChunkRow]]:
+        """
+        L2 top-k for several queries at once.
+
+        The matrix is scanned in blocks of ``SEARCH_BLOCK_ROWS``; each block costs
+        one (block x dim) @ (dim x queries) product, and ``argpartition`` keeps the
+        best candidates per block before a final sort of the few candidates.
+        With quantization the scan reads the compact codes instead and the
+        candidates are re-ranked exactly (see ``_rerank``), unless ``exact``.
+        A ``scope`` skips the scan: only the float32 rows inside it are read
+        and ranked exactly.
+        """
+        queries = np.atleast_2d(np.asarray(query_embs, dtype=np.float32))
+        rows, embeddings, norms, deleted, codes, scale = self._snapshot()
+        if not rows or top_k < 1:
+            return [[] for _ in queries]
+        if scope is not None:
+            scoped = self._scoped_rows(scope, rows)
+            if not len(scoped):
+                return [[] for _ in queries]
+            top_dist, top_rows = self._rerank(embeddings, norms, queries, np.zeros((len(scoped), len(queries))),
+                                              np.repeat(scoped[:, None], len(queries), axis=1), top_k)
+        else:
+            top_dist, top_rows = self._scan(rows, embeddings, norms, deleted, codes, scale, queries, top_k, exact)
+        query_norms = np.einsum("ij,ij->i", queries, queries)
+
+        wanted = {int(r) for r in top_rows[np.isfinite(top_dist)]}
+        with self.engine.connect() as conn:
+            meta_rows = {row.row: row for row in conn.execute(select(chunks).where(chunks.c.row.in_(wanted)))}
+
+        results = []
+        for q in range(len(queries)):
+            hits = []
+            for dist, row in zip(top_dist[:, q], top_rows[:, q]):
+                if not np.isfinite(dist) or int(row) not in meta_rows:
+                    continue
+                m = meta_rows[int(row)]
+                hits.append(ChunkRow(m.filename, m.page_number, m.chunk_id, m.text, m.start_char, m.end_char,
+                                     float(np.sqrt(max(dist + query_norms[q], 0.0)))))
+            results.append(hits)
+        return results
+
+    def _scan(self, rows, embeddings, norms, deleted, codes, scale, queries, top_k, exact):
+        """(top_k x queries) distances and rows of the best matches over the whole matrix."""
+        approximate = codes is not None and not exact
+        wanted_candidates = top_k * RERANK_FACTOR if approximate else top_k
+
+        cand_dist, cand_rows = [], []
+        for start in range(0, rows, SEARCH_BLOCK_ROWS):
+            stop = min(start + SEARCH_BLOCK_ROWS, rows)
+            if approximate:
+                dist = block_distances(self.quantization, codes[start:stop], norms[start:stop], queries, scale)
+            else:
+                # ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2; the last term doesn't change the ranking.
+                dist = norms[start:stop, None] - 2.0 * (embeddings[start:stop] @ queries.T)
+            dead = deleted[(deleted >= start) & (deleted < stop)] - start
+            dist[dead] = np.inf
+            k = min(wanted_candidates, stop - start)
+            best = np.argpartition(dist, k - 1, axis=0)[:k]
+            cand_dist.append(np.take_along_axis(dist, best, axis=0))
+            cand_rows.append(best + start)
+        cand_dist = np.concatenate(cand_dist)
+        cand_rows = np.concatenate(cand_rows)
+
+        order = np.argsort(cand_dist, axis=0)[:wanted_candidates]
+        top_dist = np.take_along_axis(cand_dist, order, axis=0)
+        top_rows = np.take_along_axis(cand_rows, order, axis=0)
+        if approximate:
+            top_dist, top_rows = self._rerank(embeddings, norms, queries, top_dist, top_rows, top_k)
+        return top_dist, top_rows
+
+    @staticmethod
+    def _rerank(embeddings, norms, queries, cand_dist, cand_rows, top_k):
+        """Exact distances for the candidates only; just their float32 rows are read from the mapping."""
+        top_dist = np.full((top_k, len(queries)), np.inf, dtype=np.float32)
+        top_rows = np.zeros((top_k, len(queries)), dtype=np.int64)
+        for q, query in enumerate(queries):
+            rows = np.unique(cand_rows[np.isfinite(cand_dist[:, q]), q])  # sorted, so reads go forward
+            dist = norms[rows] - 2.0 * (embeddings[rows] @ query)
+            best = np.argsort(dist)[:top_k]
+            top_dist[:len(best), q] = dist[best]
+            top_rows[:len(best), q] = rows[best]
+        return top_dist, top_rows
+
+    def search(self, query_emb, top_k=5, exact=False, scope=None, **knobs):
+        return self.search_many([query_emb], top_k, exact, scope)[0]
+
+    def sample_texts(self, n):
+        with self.engine.connect() as conn:
+            return list(conn.execute(
+                select(chunks.c.text).where(chunks.c.deleted == 0).order_by(func.random()).limit(n)
+            ).scalars())
+
+    def document_chunks(self, filename):
+        with self.engine.connect() as conn:
+            return [tuple(row) for row in conn.execute(
+                select(chunks.c.page_number, chunks.c.chunk_id, chunks.c.text, chunks.c.start_char, chunks.c.end_char)
+                .where(chunks.c.filename == filename, chunks.c.deleted == 0)
+                .order_by(chunks.c.page_number, func.length(chunks.c.chunk_id), chunks.c.chunk_id)
+            )]
@@ -0,0 +1,437 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Union
+from urllib.parse import urlsplit
+
+import dotenv
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import tracing
+from stats import percentile
+
+# Load environment variables from .env file
+dotenv.load_dotenv()
+
+
+def base_url(url: str) -> str:
+    """Server root of an Ollama URL, which may also be a full endpoint such as .../api/chat."""
+    parts = urlsplit(url.strip())
+    return f"{parts.scheme}://{parts.netloc}"
+
+# ---------------- Settings ---------------- #
+# The single place the Ollama endpoint, model and network policy are configured.
+OLLAMA_BASE_URL = base_url(os.getenv("OLLAMA_URL") or "http://localhost:11434")
+# Several servers (comma-separated) are load balanced with failover, see OllamaPool.
+OLLAMA_URLS = [base_url(url) for url in (os.getenv("OLLAMA_URLS") or "").split(",") if url.strip()] or [OLLAMA_BASE_URL]
+MODEL = os.getenv("MODEL") or "llama3"
+
+
+def _keep_alive(value: str) -> Union[int, str]:
+    # Ollama takes a duration ("30m") or seconds; negative keeps the model loaded indefinitely.
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+# How long Ollama keeps the model loaded after a request (Ollama's own default is 5m).
+KEEP_ALIVE = _keep_alive(os.getenv("OLLAMA_KEEP_ALIVE") or "30m")
+
+CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT") or 5)
+READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT") or 120)  # max silence between streamed bytes
+RETRIES = int(os.getenv("OLLAMA_RETRIES") or 3)
+BACKOFF_FACTOR = float(os.getenv("OLLAMA_BACKOFF") or 0.5)
+POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE") or 10)
+
+# Statuses Ollama returns while the server or a model is (re)starting.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+HEALTH_CHECK_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL") or 10)  # seconds; 0 disables the checks
+HEALTH_CHECK_TIMEOUT = 2.0
+# A conversation stays on its backend unless that one has this many more requests in flight than the least loaded.
+AFFINITY_SLACK = int(os.getenv("OLLAMA_AFFINITY_SLACK") or 1)
+AFFINITY_SESSIONS = 10000  # conversations remembered for affinity
+
+COLD_LOAD_SECONDS = 0.5  # a call that spent longer than this loading the model was a cold start
+TIMING_SAMPLES = 1000  # recent calls kept for percentiles
+
+# ---------------- Timings ---------------- #
+
+class ModelTimings:
+    """
+    Splits the latency of Ollama calls into model load time and generation time.
+
+    Both come from the durations Ollama reports with every reply:
+    ``load_duration`` is the time spent loading the model (near zero when it is
+    already loaded), ``prompt_eval_duration`` plus ``eval_duration`` is the
+    generation. A call that spent more than ``COLD_LOAD_SECONDS`` loading
+    counts as a cold start, so latency spikes can be told apart from slow
+    generation.
+    """
+
+    def __init__(self, samples: int = TIMING_SAMPLES):
+        self.calls = 0
+        self.cold_starts = 0
+        self._load = deque(maxlen=samples)
+        self._generation = deque(maxlen=samples)
+        self._lock = threading.Lock()
+
+    def record(self, reply: dict):
+        """Records a non-streamed reply or the final (``done``) chunk of a stream; others are ignored."""
+        if "total_duration" not in reply:
+            return
+        load = reply.get("load_duration", 0) / 1e9
+        generation = (reply.get("prompt_eval_duration", 0) + reply.get("eval_duration", 0)) / 1e9
+        tracing.count("llm_prompt_tokens", reply.get("prompt_eval_count", 0))
+        tracing.count("llm_tokens", reply.get("eval_count", 0))
+        if load > COLD_LOAD_SECONDS:
+            tracing.count("llm_cold_starts")
+        with self._lock:
+            self.calls += 1
+            self.cold_starts += load > COLD_LOAD_SECONDS
+            self._load.append(load)
+            self._generation.append(generation)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            load, generation = list(self._load), list(self._generation)
+            return {
+                "calls": self.calls,
+                "cold_starts": self.cold_starts,
+                "load_p50_s": round(percentile(load, 50), 4),
+                "load_p99_s": round(percentile(load, 99), 4),
+                "generation_p50_s": round(percentile(generation, 50), 4),
+                "generation_p99_s": round(percentile(generation, 99), 4),
+            }
+
+
+# Shared by every client in the process.
+model_timings = ModelTimings()
+
+# ---------------- Client ---------------- #
+
+class OllamaClient:
+    """
+    Keep-alive HTTP client for the Ollama API.
+
+    Requests share one pooled ``requests.Session``, always carry a connect and
+    read timeout, and are retried with exponential backoff on connection errors
+    and transient statuses. A streamed response is only retried before its body
+    starts arriving. Every chat and generate request asks Ollama to keep the
+    model loaded for ``keep_alive``; ``load_model`` preloads it.
+    """
+
+    def __init__(self, base_url: str = OLLAMA_BASE_URL, model: str = MODEL,
+                 connect_timeout: float = CONNECT_TIMEOUT, read_timeout: float = READ_TIMEOUT,
+                 retries: int = RETRIES, backoff_factor: float = BACKOFF_FACTOR, pool_size: int = POOL_SIZE,
+                 keep_alive: Union[int, str] = KEEP_ALIVE):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.keep_alive = keep_alive
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=None,  # Ollama's POST endpoints are safe to repeat
+            raise_on_status=False,
+        )
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def post(self, path: str, payload: dict, stream: bool = False) -> requests.Response:
+        response = self.session.post(f"{self.base_url}{path}", json=payload, stream=stream, timeout=self.timeout)
+        response.raise_for_status()
+        return response
+
+    def chat(self, messages: list, stream: bool = True, model: str = None, session: Optional[str] = None,
+             **options) -> requests.Response:
+        # ``session`` only matters to an ``OllamaPool``; a single server has nothing to pin.
+        payload = {"model": model or self.model, "messages": messages, "stream": stream,
+                   "keep_alive": self.keep_alive, **options}
+        return self.post("/api/chat", payload, stream=stream)
+
+    def generate(self, prompt: str, model: str = None, **options) -> str:
+        payload = {"model": model or self.model, "prompt": prompt, "stream": False,
+                   "keep_alive": self.keep_alive, **options}
+        with tracing.span("ollama"):
+            reply = self.post("/api/generate", payload).json()
+        model_timings.record(reply)
+        return reply["response"]
+
+    def load_model(self, model: str = None) -> float:
+        """Loads the model into memory (a request without a prompt) and returns Ollama's load time in seconds."""
+        start = time.perf_counter()
+        reply = self.post("/api/generate", {"model": model or self.model, "keep_alive": self.keep_alive}).json()
+        return reply["load_duration"] / 1e9 if "load_duration" in reply else time.perf_counter() - start
+
+    def close(self):
+        self.session.close()
+
+# ---------------- Backend pool ---------------- #
+
+class _Backend:
+    def __init__(self, client: OllamaClient):
+        self.client = client
+        self.url = client.base_url
+        self.healthy = True
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+
+
+def session_key(messages: list) -> Optional[str]:
+    """
+    Fallback conversation key for callers that pass no ``session``: a hash of the first user message.
+
+    It changes once old turns are folded into a summary (see ``chat_context``)
+    and is shared by unrelated conversations that open the same way, so
+    callers that hold a conversation should pass its own id instead.
+    """
+    for message in messages:
+        if message.get("role") == "user":
+            return hashlib.sha256(message.get("content", "").encode("utf-8")).hexdigest()
+    return None
+
+
+class FailoverStream:
+    """
+    A streamed response from an ``OllamaPool`` backend.
+
+    Used like the ``requests.Response`` it wraps (``with`` and ``iter_lines``);
+    the backend counts as busy until the stream is closed. If the connection
+    breaks in the middle of a chat reply, the request is sent to another
+    backend with the reply so far appended as the start of the assistant
+    message, so the model continues the answer instead of starting over.
+    """
+
+    def __init__(self, pool: "OllamaPool", path: str, payload: dict, session: Optional[str]):
+        self.pool = pool
+        self.path = path
+        self.payload = payload
+        self.session = session
+        self._tried = set()
+        self._backend, self._response = pool._send(path, payload, True, session, self._tried)
+
+    def iter_lines(self):
+        parts = []
+        while True:
+            try:
+                for line in self._response.iter_lines():
+                    if line:
+                        try:
+                            parts.append(json.loads(line).get("message", {}).get("content", ""))
+                        except (ValueError, AttributeError):
+                            pass
+                    yield line
+                return
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError):
+                self.pool._mark_down(self._backend)
+                self.close()
+                if self.path != "/api/chat":
+                    raise
+                payload = self.payload
+                if "".join(parts):
+                    payload = dict(payload, messages=payload["messages"] + [
+                        {"role": "assistant", "content": "".join(parts)}
+                    ])
+                self._backend, self._response = self.pool._send(self.path, payload, True, self.session, self._tried)
+
+    def close(self):
+        if self._response is not None:
+            self._response.close()
+            self.pool._release(self._backend)
+            self._response = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class OllamaPool:
+    """
+    Spreads requests over several Ollama servers, with the ``OllamaClient`` API.
+
+    Each request goes to the healthy backend with the fewest requests in flight.
+    Chat turns of one conversation (the ``session`` id passed to ``chat``, see
+    ``session_key`` for the fallback) prefer the backend that
+    served the previous turn, where the model and the conversation's prompt
+    cache are warm, unless it is ``affinity_slack`` requests busier than the
+    least loaded one. A backend that fails to connect, times out or answers
+    with a server error is skipped and the request is sent to the next one; a
+    streamed chat fails over mid-stream (see ``FailoverStream``). A background
+    thread polls every backend's ``/api/version`` every
+    ``health_check_interval`` seconds and takes failed backends out of (and
+    recovered ones back into) rotation. When no backend is known to be healthy,
+    all of them are tried.
+    """
+
+    def __init__(self, urls: List[str] = OLLAMA_URLS, model: str = MODEL, pool_size: int = POOL_SIZE,
+                 health_check_interval: float = HEALTH_CHECK_INTERVAL, affinity_slack: int = AFFINITY_SLACK,
+                 keep_alive: Union[int, str] = KEEP_ALIVE, **client_options):
+        self.model = model
+        self.keep_alive = keep_alive
+        self.affinity_slack = affinity_slack
+        # Failing over to another backend replaces retrying the same one.
+        client_options.setdefault("retries", 0)
+        self.backends = [_Backend(OllamaClient(base_url(url), model, pool_size=pool_size, keep_alive=keep_alive,
+                                               **client_options))
+                         for url in urls]
+        if not self.backends:
+            raise ValueError("OllamaPool needs at least one URL")
+        self._affinity = OrderedDict()  # session -> backend url
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self.health_check_interval = health_check_interval
+        if health_check_interval > 0:
+            threading.Thread(target=self._health_loop, name="ollama-health", daemon=True).start()
+
+    # ---------------- Routing ---------------- #
+
+    def _pick(self, session: Optional[str], exclude: set) -> Optional[_Backend]:
+        with self._lock:
+            candidates = [b for b in self.backends if b.url not in exclude]
+            if not candidates:
+                return None
+            healthy = [b for b in candidates if b.healthy] or candidates
+            backend = min(healthy, key=lambda b: (b.in_flight, b.requests))
+            if session is not None:
+                preferred = next((b for b in healthy if b.url == self._affinity.get(session)), None)
+                if preferred is not None and preferred.in_flight <= backend.in_flight + self.affinity_slack:
+                    backend = preferred
+                self._affinity[session] = backend.url
+                self._affinity.move_to_end(session)
+                while len(self._affinity) > AFFINITY_SESSIONS:
+                    self._affinity.popitem(last=False)
+            backend.in_flight += 1
+            backend.requests += 1
+            return backend
+
+    def _release(self, backend: _Backend):
+        with self._lock:
+            backend.in_flight -= 1
+
+    def _mark_down(self, backend: _Backend):
+        with self._lock:
+            backend.healthy = False
+            backend.failures += 1
+
+    def _send(self, path: str, payload: dict, stream: bool, session: Optional[str], tried: set):
+        """(backend, response) from the first backend that answers; the caller releases the backend."""
+        error = None
+        while True:
+            backend = self._pick(session, tried)
+            if backend is None:
+                raise error or requests.exceptions.ConnectionError("no Ollama backend available")
+            tried.add(backend.url)
+            try:
+                return backend, backend.client.post(path, payload, stream=stream)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self._release(backend)
+                self._mark_down(backend)
+                error = e
+            except requests.exceptions.HTTPError as e:
+                self._release(backend)
+                if e.response is None or e.response.status_code not in RETRY_STATUSES:
+                    raise
+                error = e  # busy or restarting, but still up
+
+    # ---------------- Public API ---------------- #
+
+    def post(self, path: str, payload: dict, stream: bool = False, session: Optional[str] = None):
+        if stream:
+            return FailoverStream(self, path, payload, session)
+        backend, response = self._send(path, payload, False, session, set())
+        self._release(backend)
+        return response
+
+    def chat(self, messages: list, stream: bool = True, model: str = None, session: Optional[str] = None,
+             **options):
+        payload = {"model": model or self.model, "messages": messages, "stream": stream,
+                   "keep_alive": self.keep_alive, **options}
+        return self.post("/api/chat", payload, stream=stream, session=session or session_key(messages))
+
+    def generate(self, prompt: str, model: str = None, **options) -> str:
+        payload = {"model": model or self.model, "prompt": prompt, "stream": False,
+                   "keep_alive": self.keep_alive, **options}
+        with tracing.span("ollama"):
+            reply = self.post("/api/generate", payload).json()
+        model_timings.record(reply)
+        return reply["response"]
+
+    def load_model(self, model: str = None) -> float:
+        """Loads the model on every reachable backend, so whichever serves the first request is warm."""
+        loads = []
+        for backend in self.backends:
+            try:
+                loads.append(backend.client.load_model(model))
+            except requests.exceptions.RequestException:
+                self._mark_down(backend)
+        if not loads:
+            raise requests.exceptions.ConnectionError("no Ollama backend could load the model")
+        return max(loads)
+
+    # ---------------- Health ---------------- #
+
+    def check_health(self):
+        for backend in self.backends:
+            try:
+                requests.get(f"{backend.url}/api/version", timeout=HEALTH_CHECK_TIMEOUT).raise_for_status()
+                healthy = True
+            except requests.exceptions.RequestException:
+                healthy = False
+            with self._lock:
+                backend.healthy = healthy
+
+    def _health_loop(self):
+        while not self._closed.wait(self.health_check_interval):
+            self.check_health()
+
+    def stats(self) -> List[dict]:
+        with self._lock:
+            return [{"url": b.url, "healthy": b.healthy, "in_flight": b.in_flight, "requests": b.requests,
+                     "failures": b.failures} for b in self.backends]
+
+    def close(self):
+        self._closed.set()
+        for backend in self.backends:
+            backend.client.close()
+
+
+def make_client(**options):
+    """An ``OllamaPool`` when several ``OLLAMA_URLS`` are configured, a plain ``OllamaClient`` otherwise."""
+    if len(OLLAMA_URLS) > 1:
+        return OllamaPool(OLLAMA_URLS, **options)
+    return OllamaClient(OLLAMA_URLS[0], **options)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Process-wide client (see ``make_client``), so every caller shares the same connection pool."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = make_client()
+        return _client
+
+
+def get_ollama_response(prompt: str, model: str = None) -> str:
+    try:
+        return get_client().generate(prompt, model)
+    except requests.exceptions.RequestException as e:
+        return f"Error contacting Ollama: {str(e)}"
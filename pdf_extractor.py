@@ -1,87 +1,103 @@
 import fitz  # PyMuPDF
 import streamlit as st
-import tempfile
 import os
-from typing import List, Dict
+from typing import BinaryIO, Dict, Iterator, Optional, Union
 
+from chunker import DEFAULT_CHUNK_TOKENS, DEFAULT_OVERLAP_TOKENS, Chunker, tokenizer_for
 
-def extract_text_by_page(pdf_path: str) -> List[Dict]:
-    doc = fitz.open(pdf_path)
-    filename = os.path.basename(pdf_path)
-    pages = []
+# A path on disk, raw PDF bytes (e.g. an upload's buffer) or a binary file object.
+PdfSource = Union[str, os.PathLike, bytes, bytearray, memoryview, BinaryIO]
 
-    for i, page in enumerate(doc):
-        page_text = page.get_text()
-        pages.append({
-            "filename": filename,
-            "page_number": i + 1,
-            "text": page_text.strip()
-        })
 
-    return pages
+def open_pdf(source: PdfSource) -> fitz.Document:
+    """
+    Opens a PDF without copying it to a temporary file.
 
+    Paths are opened directly so MuPDF reads pages from disk on demand; bytes
+    and file objects (including Streamlit uploads) are opened as an in-memory
+    stream.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        return fitz.open(source)
+    if hasattr(source, "getbuffer"):
+        source = source.getbuffer()
+    elif hasattr(source, "read"):
+        source = source.read()
+    return fitz.open(stream=source, filetype="pdf")
 
-def chunk_text(text: str, chunk_size: int = 500, overlap: int = 100) -> List[str]:
-    words = text.split()
-    chunks = []
-    start = 0
 
-    while start < len(words):
-        end = start + chunk_size
-        chunk = words[start:end]
-        chunks.append(" ".join(chunk))
-        start += chunk_size - overlap
+def source_name(source: PdfSource, filename: Optional[str] = None) -> str:
+    if filename:
+        return filename
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.basename(source)
+    return os.path.basename(getattr(source, "name", "") or "document.pdf")
 
-    return chunks
 
+def count_pages(source: PdfSource) -> int:
+    with open_pdf(source) as doc:
+        return doc.page_count
 
-def extract_pdf_chunks(pdf_path: str, chunk_size=500, overlap=100) -> List[Dict]:
-    page_data = extract_text_by_page(pdf_path)
-    all_chunks = []
 
-    for page in page_data:
-        chunks = chunk_text(page["text"], chunk_size, overlap)
-        for i, chunk in enumerate(chunks):
-            all_chunks.append({
-                "filename": page["filename"],
-                "page_number": page["page_number"],
-                "chunk_id": f"{page['page_number']}_{i + 1}",
-                "text": chunk
-            })
+def extract_text_by_page(source: PdfSource, filename: Optional[str] = None) -> Iterator[Dict]:
+    """Lazily yields one record per page; only the current page's text is held in memory."""
+    filename = source_name(source, filename)
+    with open_pdf(source) as doc:
+        title = (doc.metadata or {}).get("title") or filename
+        for i, page in enumerate(doc):
+            yield {
+                "filename": filename,
+                "title": title.strip(),
+                "page_number": i + 1,
+                "text": page.get_text().strip()
+            }
 
-    return all_chunks
+
+def extract_pdf_chunks(source: PdfSource, chunk_size: int = DEFAULT_CHUNK_TOKENS,
+                       overlap: int = DEFAULT_OVERLAP_TOKENS, filename: Optional[str] = None,
+                       tokenizer=None) -> Iterator[Dict]:
+    """
+    Lazily yields chunk records page by page, so peak memory does not grow with document size.
+
+    ``chunk_size`` and ``overlap`` are in tokens of ``tokenizer``, by default the
+    embedding model's own (see ``chunker.Chunker``).
+    """
+    chunker = Chunker(tokenizer or tokenizer_for(), chunk_size, overlap)
+    yield from chunker.chunk_pages(extract_text_by_page(source, filename))
 
 
 # ---------------- Streamlit UI ---------------- #
 
-st.title("📄 PDF Reader")
+def main():
+    st.title("📄 PDF Reader")
 
-# Sidebar controls
-st.sidebar.header("🧩 Chunk Settings")
-chunk_size = st.sidebar.slider("Chunk size (words)", min_value=100, max_value=1000, value=500, step=50)
-overlap = st.sidebar.slider("Overlap size (words)", min_value=0, max_value=500, value=100, step=25)
+    # Sidebar controls
+    st.sidebar.header("🧩 Chunk Settings")
+    chunk_size = st.sidebar.slider("Chunk size (tokens)", min_value=32, max_value=256, value=DEFAULT_CHUNK_TOKENS, step=2)
+    overlap = st.sidebar.slider("Overlap size (tokens)", min_value=0, max_value=128, value=DEFAULT_OVERLAP_TOKENS, step=8)
 
-# File upload
-uploaded_file = st.file_uploader("Upload a PDF file", type=["pdf"])
+    # File upload
+    uploaded_file = st.file_uploader("Upload a PDF file", type=["pdf"])
 
-if uploaded_file is not None:
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-        tmp_file.write(uploaded_file.read())
-        tmp_path = tmp_file.name
+    if uploaded_file is not None:
+        st.success("✅ PDF uploaded successfully!")
+        st.info(f"Extracting and chunking text (chunk size: {chunk_size}, overlap: {overlap})...")
 
-    st.success("✅ PDF uploaded successfully!")
-    st.info(f"Extracting and chunking text (chunk size: {chunk_size}, overlap: {overlap})...")
+        try:
+            total = 0
+            st.subheader("Preview of Extracted Chunks:")
+            for chunk in extract_pdf_chunks(uploaded_file, chunk_size, overlap, filename=uploaded_file.name):
+                # Show preview
+                if total < 5:
+                    st.markdown(f"**Page {chunk['page_number']} | Chunk {chunk['chunk_id']}**")
+                    st.text(chunk['text'])
+                    st.divider()
+                total += 1
+            st.success(f"✅ Extracted {total} chunks from {uploaded_file.name}.")
 
-    try:
-        chunks = extract_pdf_chunks(tmp_path, chunk_size, overlap)
-        st.success(f"✅ Extracted {len(chunks)} chunks from {uploaded_file.name}.")
+        except Exception as e:
+            st.error(f"❌ Error: {e}")
 
-        # Show preview
-        st.subheader("Preview of Extracted Chunks:")
-        for chunk in chunks[:5]:
-            st.markdown(f"**Page {chunk['page_number']} | Chunk {chunk['chunk_id']}**")
-            st.text(chunk['text'])
-            st.divider()
 
-    except Exception as e:
-        st.error(f"❌ Error: {e}")
+if __name__ == "__main__":
+    main()
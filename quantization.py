@@ -0,0 +1,67 @@
+import os
+from typing import Optional
+
+import numpy as np
+
+# ---------------- Settings ---------------- #
+# Compact form scanned for candidates: none, half (float16, 2x smaller),
+# int8 (scalar quantization, 4x) or binary (sign bits, 32x).
+VECTOR_QUANTIZATION = (os.getenv("VECTOR_QUANTIZATION") or "none").lower()
+QUANTIZATIONS = ("none", "half", "int8", "binary")
+# Candidates fetched per result before the exact re-rank.
+RERANK_FACTOR = int(os.getenv("RERANK_FACTOR") or 4)
+INT8_SCALE_MARGIN = 1.5  # headroom over the largest component seen when the scale is chosen
+
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# ---------------- Codes ---------------- #
+
+def check_quantization(kind: str) -> str:
+    if kind not in QUANTIZATIONS:
+        raise ValueError(f"Unknown vector quantization: {kind}")
+    return kind
+
+
+def code_dtype(kind: str):
+    return {"half": np.float16, "int8": np.int8, "binary": np.uint8}[kind]
+
+
+def code_width(kind: str, dim: int) -> int:
+    """Number of ``code_dtype`` items stored per vector."""
+    return (dim + 7) // 8 if kind == "binary" else dim
+
+
+def int8_scale(embeddings: np.ndarray) -> float:
+    """One scale for the whole store, picked from the first vectors written; outliers are clipped."""
+    peak = float(np.abs(embeddings).max()) if embeddings.size else 1.0
+    return (peak or 1.0) * INT8_SCALE_MARGIN / 127
+
+
+def encode(embeddings: np.ndarray, kind: str, scale: Optional[float] = None) -> np.ndarray:
+    """Compact codes for float32 ``embeddings`` (one row per vector)."""
+    if kind == "half":
+        return embeddings.astype(np.float16)
+    if kind == "int8":
+        return np.clip(np.rint(embeddings / scale), -127, 127).astype(np.int8)
+    if kind == "binary":
+        return np.packbits(embeddings > 0, axis=1)
+    raise ValueError(f"No codes for quantization: {kind}")
+
+
+def block_distances(kind: str, codes: np.ndarray, norms: np.ndarray, queries: np.ndarray,
+                    scale: Optional[float] = None) -> np.ndarray:
+    """
+    Approximate (rows x queries) distances between a block of codes and the queries.
+
+    ``half`` and ``int8`` approximate squared L2 less the constant ``||q||^2``,
+    like the exact scan; ``binary`` is the Hamming distance of the sign bits.
+    Only the ranking matters, as candidates are re-ranked exactly.
+    """
+    if kind == "binary":
+        query_bits = np.packbits(queries > 0, axis=1)
+        return np.stack([POPCOUNT[codes ^ bits].sum(axis=1, dtype=np.int32) for bits in query_bits],
+                        axis=1).astype(np.float32)
+    vectors = codes.astype(np.float32)
+    if kind == "int8":
+        vectors *= scale
+    return norms[:, None] - 2.0 * (vectors @ queries.T)
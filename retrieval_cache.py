@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional
+
+import numpy as np
+
+import tracing
+
+# ---------------- Settings ---------------- #
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE") or 1024)  # query embeddings kept
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE") or 512)  # search results kept
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL") or 300)  # seconds; also guards against writes made outside ingest
+
+_MISSING = object()
+
+
+def _hashable(value):
+    """Search options as a cache key part: lists, sets and dicts (e.g. filename filters) become tuples."""
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(_hashable(v) for v in value))
+    if isinstance(value, dict):
+        return tuple(sorted((k, _hashable(v)) for k, v in value.items()))
+    return value
+
+# ---------------- Cache ---------------- #
+
+class LRUCache:
+    """Thread-safe LRU map with an optional per-entry TTL and hit/miss counters."""
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > time.monotonic()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class RetrievalCache:
+    """
+    Caches query embeddings and search results in front of a vector store.
+
+    Embeddings are keyed by the query text alone. Results are keyed by
+    (query, top_k, search options, corpus version). The corpus version is
+    bumped in the same transaction as every ingestion write, so a result
+    computed before a write is never served after it. Each lookup still reads
+    the version, which is a single-row query, much cheaper than encoding the
+    query and running the search.
+    """
+
+    def __init__(self, store, embedding_model, query_cache_size: int = QUERY_CACHE_SIZE,
+                 result_cache_size: int = RESULT_CACHE_SIZE, result_ttl: float = RESULT_CACHE_TTL):
+        self.store = store
+        self.embedding_model = embedding_model
+        self.embeddings = LRUCache(query_cache_size)
+        self.results = LRUCache(result_cache_size, result_ttl)
+
+    def embed(self, query: str) -> np.ndarray:
+        query = query.strip()
+        embedding = self.embeddings.get(query)
+        if embedding is not None:
+            tracing.count("query_embedding_cache_hits")
+        else:
+            tracing.count("query_embedding_cache_misses")
+            with tracing.span("embed_query"):
+                embedding = np.asarray(self.embedding_model.encode(query), dtype=np.float32)
+            embedding.flags.writeable = False  # shared between callers
+            self.embeddings.put(query, embedding)
+        return embedding
+
+    @tracing.traced("search")
+    def search(self, query: str, top_k: int = 5, **options) -> List:
+        """``store.search`` for a query text; ``options`` (filters, recall knobs) are part of the key."""
+        query = query.strip()
+        key = (query, top_k, _hashable(options), self.store.corpus_version())
+        rows = self.results.get(key, _MISSING)
+        if rows is not _MISSING:
+            tracing.count("retrieval_cache_hits")
+        else:
+            tracing.count("retrieval_cache_misses")
+            query_emb = self.embed(query)
+            with tracing.span("vector_search"):
+                rows = self.store.search(query_emb, top_k, **options)
+            self.results.put(key, rows)
+        return list(rows)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {"embeddings": self.embeddings.stats(), "results": self.results.stats()}
@@ -0,0 +1,63 @@
+from collections import namedtuple
+from datetime import datetime
+from typing import Iterable, Optional, Tuple, Union
+
+from sqlalchemy import and_, select, true
+
+import manifest
+
+# Part of the corpus a search is restricted to; ``None`` fields don't restrict.
+# ``pages`` is an inclusive (first, last) range, either end may be None.
+SearchScope = namedtuple("SearchScope", ["filenames", "pages", "ingested_after", "ingested_before"])
+
+
+def search_scope(filenames: Union[str, Iterable[str], None] = None,
+                 pages: Optional[Tuple[Optional[int], Optional[int]]] = None,
+                 ingested_after: Optional[datetime] = None,
+                 ingested_before: Optional[datetime] = None) -> Optional[SearchScope]:
+    """
+    A hashable scope for ``VectorStore.search``, or None if nothing restricts the search.
+
+    Filenames are the names documents were stored under (``ingest_document``'s
+    ``stats["filename"]``); ingestion dates refer to the latest ingestion of a
+    document as recorded in the manifest.
+    """
+    if isinstance(filenames, str):
+        filenames = (filenames,)
+    elif filenames is not None:
+        filenames = tuple(sorted(set(filenames)))
+    if pages is not None:
+        first, last = pages
+        pages = (None if first is None else int(first), None if last is None else int(last))
+        if pages == (None, None):
+            pages = None
+    scope = SearchScope(filenames, pages, ingested_after, ingested_before)
+    return None if scope == SearchScope(None, None, None, None) else scope
+
+
+def scope_condition(table, scope: SearchScope):
+    """
+    WHERE clause restricting a chunk table (``filename``/``page_number`` columns) to ``scope``.
+
+    Filename and page conditions are served by the (filename, page_number)
+    index; date conditions select filenames from the manifest through its
+    ``ingested_at`` index.
+    """
+    conditions = []
+    if scope.filenames is not None:
+        conditions.append(table.c.filename.in_(scope.filenames))
+    if scope.pages is not None:
+        first, last = scope.pages
+        if first is not None:
+            conditions.append(table.c.page_number >= first)
+        if last is not None:
+            conditions.append(table.c.page_number <= last)
+    documents = manifest.pdf_documents
+    dated = []
+    if scope.ingested_after is not None:
+        dated.append(documents.c.ingested_at >= scope.ingested_after)
+    if scope.ingested_before is not None:
+        dated.append(documents.c.ingested_at < scope.ingested_before)
+    if dated:
+        conditions.append(table.c.filename.in_(select(documents.c.filename).where(*dated)))
+    return and_(*conditions) if conditions else true()
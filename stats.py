@@ -0,0 +1,10 @@
+from typing import Iterable
+
+# ---------------- Functions ---------------- #
+
+def percentile(values: Iterable[float], pct: float) -> float:
+    """Nearest-rank ``pct`` percentile of ``values``; 0.0 when there are none."""
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
@@ -0,0 +1,185 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+import requests
+from sqlalchemy import Column, DateTime, MetaData, String, Table, Text, func, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from chat_context import CHARS_PER_TOKEN, count_tokens
+from ollama_client import get_client
+
+# ---------------- Settings ---------------- #
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY") or 4)  # LLM calls in flight per document
+SUMMARY_GROUP_TOKENS = int(os.getenv("SUMMARY_GROUP_TOKENS") or 2000)  # most text sent in one map call
+SUMMARY_FANOUT = 8  # partial summaries combined per reduce call
+# A group also ends after any page (or, when reducing, partial summary) whose text hash is
+# divisible by this, so group boundaries follow content: an edited page shifts at most the
+# groups up to the next such page, at every level.
+BOUNDARY_MODULUS = 4
+MIN_REDUCE_GROUP = 2  # so every reduce level at least halves
+PARTIAL_MAX_WORDS = 120
+
+MAP_PROMPT = """Summarize the following excerpt of a longer document in at most {max_words} words.
+Keep key facts, names, numbers and conclusions. Reply with the summary only.
+
+{text}
+"""
+
+REDUCE_PROMPT = """The following are summaries of consecutive parts of one document.
+Combine them into a single summary of at most {max_words} words. Reply with the summary only.
+
+{text}
+"""
+
+FINAL_PROMPT = """The following are summaries of consecutive parts of one document.
+Summarize the whole document in 5 sentences.
+
+{text}
+"""
+
+metadata = MetaData()
+
+# Partial and final summaries, keyed by a hash of the model, the prompt and the text summarized.
+summary_cache = Table(
+    "summary_cache",
+    metadata,
+    Column("key", String(64), primary_key=True),
+    Column("summary", Text, nullable=False),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+# ---------------- Functions ---------------- #
+
+def summary_key(model: str, prompt: str) -> str:
+    return hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+def split_text(text: str, max_tokens: int) -> List[str]:
+    """Cuts an oversized text at whitespace into pieces of at most ``max_tokens`` estimated tokens."""
+    limit = max_tokens * CHARS_PER_TOKEN
+    pieces = []
+    while len(text) > limit:
+        cut = text.rfind(" ", 0, limit)
+        cut = cut if cut > 0 else limit
+        pieces.append(text[:cut])
+        text = text[cut:].lstrip()
+    if text:
+        pieces.append(text)
+    return pieces
+
+
+def is_boundary(text: str) -> bool:
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16) % BOUNDARY_MODULUS == 0
+
+
+def page_groups(pages: Iterable[Dict], group_tokens: int = SUMMARY_GROUP_TOKENS) -> Iterator[str]:
+    """Lazily joins consecutive page texts into groups of at most ``group_tokens``."""
+    group, size = [], 0
+    for page in pages:
+        for piece in split_text(page["text"], group_tokens):
+            tokens = count_tokens(piece)
+            if group and size + tokens > group_tokens:
+                yield "\n\n".join(group)
+                group, size = [], 0
+            group.append(piece)
+            size += tokens
+        if group and is_boundary(page["text"]):
+            yield "\n\n".join(group)
+            group, size = [], 0
+    if group:
+        yield "\n\n".join(group)
+
+
+def reduce_groups(parts: List[str], fanout: int = SUMMARY_FANOUT) -> List[List[str]]:
+    """
+    Cuts one level of partial summaries into groups of at most ``fanout``.
+
+    Groups end at content boundaries like ``page_groups``, so a partial
+    summary added or removed near the start of a document regroups only its
+    neighbours instead of shifting every later group (and its cache key).
+    """
+    groups, group = [], []
+    for part in parts:
+        group.append(part)
+        if len(group) >= fanout or (len(group) >= MIN_REDUCE_GROUP and is_boundary(part)):
+            groups.append(group)
+            group = []
+    if group:
+        groups.append(group)
+    return groups
+
+# ---------------- Summarizer ---------------- #
+
+class DocumentSummarizer:
+    """
+    Hierarchical map-reduce summarizer for whole documents.
+
+    Pages are grouped into excerpts of at most ``group_tokens``, which are
+    summarized concurrently (map). The partial summaries are combined, up to
+    ``fanout`` at a time (see ``reduce_groups``), into section summaries until
+    few enough remain for the final document summary (reduce). Every LLM
+    result is stored in the ``summary_cache`` table on ``engine`` under the
+    hash of its prompt, so a re-upload costs nothing and a revision only
+    re-summarizes the groups that changed and the reduce steps above them.
+    """
+
+    def __init__(self, engine, generate: Optional[Callable[[str], str]] = None, model: Optional[str] = None,
+                 concurrency: int = SUMMARY_CONCURRENCY, group_tokens: int = SUMMARY_GROUP_TOKENS,
+                 fanout: int = SUMMARY_FANOUT):
+        self.engine = engine
+        self.generate = generate or (lambda prompt: get_client().generate(prompt))
+        self.model = model or get_client().model
+        self.concurrency = concurrency
+        self.group_tokens = group_tokens
+        self.fanout = fanout
+        self.calls = 0
+        self.cache_hits = 0
+        with engine.begin() as conn:
+            metadata.create_all(conn, checkfirst=True)
+
+    def _cached(self, key: str) -> Optional[str]:
+        with self.engine.connect() as conn:
+            return conn.execute(select(summary_cache.c.summary).where(summary_cache.c.key == key)).scalar()
+
+    def _store(self, key: str, summary: str):
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(insert(summary_cache), {"key": key, "summary": summary})
+        except IntegrityError:
+            pass  # another job summarized the same text first
+
+    def _summarize(self, template: str, text: str, max_words: int = PARTIAL_MAX_WORDS) -> str:
+        prompt = template.format(max_words=max_words, text=text)
+        key = summary_key(self.model, prompt)
+        summary = self._cached(key)
+        if summary is not None:
+            self.cache_hits += 1
+            return summary
+        self.calls += 1
+        summary = self.generate(prompt).strip()
+        self._store(key, summary)  # stored right away, so a failed run keeps its finished parts
+        return summary
+
+    def summarize_pages(self, pages: Iterable[Dict]) -> str:
+        """Summarizes a document given as page records (dicts with ``text``)."""
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="summarize") as pool:
+            futures = [pool.submit(self._summarize, MAP_PROMPT, group)
+                       for group in page_groups(pages, self.group_tokens)]
+            level = [f.result() for f in futures]
+            if not level:
+                return "The document has no extractable text."
+            while len(level) > self.fanout:
+                level = list(pool.map(
+                    lambda part: self._summarize(REDUCE_PROMPT, "\n\n".join(part)),
+                    reduce_groups(level, self.fanout),
+                ))
+            return self._summarize(FINAL_PROMPT, "\n\n".join(level))
+
+    def summarize_document(self, pages: Iterable[Dict]) -> str:
+        """``summarize_pages`` that reports Ollama failures as text, like ``get_ollama_response``."""
+        try:
+            return self.summarize_pages(pages)
+        except requests.exceptions.RequestException as e:
+            return f"Error contacting Ollama: {str(e)}"
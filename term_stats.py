@@ -0,0 +1,136 @@
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import Column, Integer, MetaData, Table, Text, delete, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+# ---------------- Settings ---------------- #
+TERM_PATTERN = re.compile(r"\b\w+\b")
+STOPWORDS = frozenset([
+    "the", "and", "to", "of", "a", "in", "for", "on", "with", "is", "that", "by", "this",
+    "as", "are", "at", "an", "be", "from", "or", "it", "which", "but", "has", "have"
+])
+MIN_TERM_LENGTH = 3
+IN_CLAUSE_SIZE = 500  # terms per IN (...) list, well below SQLite's parameter limit
+
+metadata = MetaData()
+
+# Term frequencies of each ingested document, counted once over its page text (not the overlapping chunks).
+pdf_document_terms = Table(
+    "pdf_document_terms",
+    metadata,
+    Column("filename", Text, primary_key=True),
+    Column("term", Text, primary_key=True),
+    Column("count", Integer, nullable=False),
+)
+
+# Corpus-wide totals, kept in step with pdf_document_terms: ``count`` is the
+# total frequency of a term, ``doc_freq`` the number of documents containing it.
+pdf_corpus_terms = Table(
+    "pdf_corpus_terms",
+    metadata,
+    Column("term", Text, primary_key=True),
+    Column("count", Integer, nullable=False),
+    Column("doc_freq", Integer, nullable=False),
+)
+
+# ---------------- Functions ---------------- #
+
+def ensure_term_tables(conn):
+    metadata.create_all(conn, checkfirst=True)
+
+
+def extract_terms(text: str) -> Iterator[str]:
+    """Lower-cased words of ``text`` without stopwords and very short words."""
+    for term in TERM_PATTERN.findall(text.lower()):
+        if len(term) >= MIN_TERM_LENGTH and term not in STOPWORDS:
+            yield term
+
+
+def _slices(terms: Iterable[str]) -> Iterator[List[str]]:
+    terms = sorted(terms)
+    for start in range(0, len(terms), IN_CLAUSE_SIZE):
+        yield terms[start:start + IN_CLAUSE_SIZE]
+
+
+def document_terms(conn, filename: str) -> Dict[str, int]:
+    rows = conn.execute(
+        select(pdf_document_terms.c.term, pdf_document_terms.c.count)
+        .where(pdf_document_terms.c.filename == filename)
+    )
+    return {row.term: row.count for row in rows}
+
+
+def has_document_terms(conn, filename: str) -> bool:
+    sql = select(pdf_document_terms.c.term).where(pdf_document_terms.c.filename == filename).limit(1)
+    return conn.execute(sql).first() is not None
+
+
+def _update_corpus(conn, old: Dict[str, int], new: Dict[str, int]):
+    """
+    Applies the difference between a document's old and new counts to the corpus totals.
+
+    Each term's delta is added with one INSERT ... ON CONFLICT DO UPDATE, so
+    concurrent ingests adding the same new term don't collide on its primary
+    key. Rows go in term order, which keeps their row locks from deadlocking.
+    """
+    rows = []
+    for term in sorted(set(old) | set(new)):
+        count = new.get(term, 0) - old.get(term, 0)
+        doc_freq = (term in new) - (term in old)
+        if count or doc_freq:
+            rows.append({"term": term, "count": count, "doc_freq": doc_freq})
+    if not rows:
+        return
+    upsert = (postgresql.insert if conn.dialect.name == "postgresql" else sqlite.insert)(pdf_corpus_terms)
+    conn.execute(upsert.on_conflict_do_update(
+        index_elements=[pdf_corpus_terms.c.term],
+        set_={"count": pdf_corpus_terms.c.count + upsert.excluded.count,
+              "doc_freq": pdf_corpus_terms.c.doc_freq + upsert.excluded.doc_freq},
+    ), rows)
+    for terms in _slices(row["term"] for row in rows if row["count"] < 0):
+        conn.execute(delete(pdf_corpus_terms).where(pdf_corpus_terms.c.term.in_(terms), pdf_corpus_terms.c.count <= 0))
+
+
+def record_document_terms(conn, filename: str, counts: Dict[str, int]):
+    """Replaces a document's term counts and updates the corpus totals by the difference only."""
+    old = document_terms(conn, filename)
+    new = {term: count for term, count in counts.items() if count > 0}
+    if old == new:
+        return
+    _update_corpus(conn, old, new)
+    conn.execute(delete(pdf_document_terms).where(pdf_document_terms.c.filename == filename))
+    if new:
+        conn.execute(insert(pdf_document_terms), [
+            {"filename": filename, "term": term, "count": count} for term, count in new.items()
+        ])
+
+
+def forget_document_terms(conn, filename: str):
+    record_document_terms(conn, filename, {})
+
+
+def top_terms(conn, filename: Optional[str] = None, n: int = 10) -> List[Tuple[str, int]]:
+    """The ``n`` most frequent terms of one document, or of the whole corpus if no filename is given."""
+    if filename is None:
+        table = pdf_corpus_terms
+        sql = select(table.c.term, table.c.count)
+    else:
+        table = pdf_document_terms
+        sql = select(table.c.term, table.c.count).where(table.c.filename == filename)
+    return [tuple(row) for row in conn.execute(sql.order_by(table.c.count.desc(), table.c.term).limit(n))]
+
+
+def document_frequencies(conn, terms: Iterable[str]) -> Dict[str, int]:
+    """Number of documents containing each term, e.g. for IDF weights in lexical scoring."""
+    freqs = {}
+    for batch in _slices(set(terms)):
+        rows = conn.execute(
+            select(pdf_corpus_terms.c.term, pdf_corpus_terms.c.doc_freq).where(pdf_corpus_terms.c.term.in_(batch))
+        )
+        freqs.update({row.term: row.doc_freq for row in rows})
+    return freqs
+
+
+def document_count(conn) -> int:
+    return conn.execute(select(func.count(func.distinct(pdf_document_terms.c.filename)))).scalar()
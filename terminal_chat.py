@@ -1,19 +1,26 @@
 import sys
 import os
+import uuid
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from chat.chat import chat_with_llm
+from chat.chat import stream_chat_with_llm
 
 def main():
     print("💬 Terminal Chatbot: \n What can I help you with today? Ask me any question about American History \n Type 'exit' to quit.\n")
     history = []
+    session = uuid.uuid4().hex  # keeps every turn on the same Ollama server
 
     while True:
         user_input = input("You: ")
         if user_input.lower() in ("exit", "quit"):
             break
-        reply, history = chat_with_llm(user_input, history)
-        print(f"Assistant: {reply}\n")
+        stream = stream_chat_with_llm(user_input, history, session=session)
+        # Print tokens as they arrive so the reply starts appearing right away
+        print("Assistant: ", end="", flush=True)
+        for token in stream:
+            print(token, end="", flush=True)
+        print("\n")
+        history = stream.history
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,287 @@
+"""
+Per-stage timing spans and counters for the RAG pipeline.
+
+    with tracing.trace("question") as t:     # one request
+        with tracing.span("search"):          # one stage of it
+            ...
+        tracing.count("retrieval_cache_hits")
+    t.breakdown()                             # [{"stage", "ms", "count"}, ...]
+
+Spans nest: a stage's ``self_ms`` excludes the stages run inside it, so the
+breakdown of a request adds up to its total. ``timed`` wraps an iterator and
+times only the work done producing each item, not what the consumer does with
+it; that is how the lazily streamed ingestion stages are told apart.
+
+Tracing is on when ``TRACE_LOG`` (a JSONL file, one line per finished trace)
+or ``METRICS_PORT`` (a Prometheus ``/metrics`` endpoint, see ``serve_metrics``)
+is set. Off, ``span`` and ``count`` return after a flag and a context variable
+lookup, unless a trace was started with ``force=True``, which is how the
+Streamlit apps show a latency breakdown without logging anything. A top-level
+span outside any trace is a trace of its own.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# ---------------- Settings ---------------- #
+TRACE_LOG = os.getenv("TRACE_LOG") or ""  # JSONL trace file; empty disables it
+METRICS_PORT = int(os.getenv("METRICS_PORT") or 0)  # Prometheus endpoint port; 0 disables it
+METRICS_HOST = os.getenv("METRICS_HOST") or "0.0.0.0"
+ENABLED = bool(TRACE_LOG or METRICS_PORT)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)  # seconds
+METRIC_PREFIX = "rag"
+
+_trace = ContextVar("trace", default=None)
+_span = ContextVar("span", default=None)
+
+# ---------------- Metrics ---------------- #
+
+class Metrics:
+    """Process-wide counters and per-stage latency histograms, rendered in Prometheus text format."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counters = {}
+        self.stages = {}  # stage -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def count(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            row = self.stages.get(stage)
+            if row is None:
+                row = self.stages[stage] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    row[i] += 1
+            row[-2] += 1
+            row[-1] += seconds
+
+    def render(self) -> str:
+        with self._lock:
+            counters = dict(self.counters)
+            stages = {stage: list(row) for stage, row in self.stages.items()}
+        name = f"{METRIC_PREFIX}_stage_seconds"
+        lines = [f"# HELP {name} Time spent per pipeline stage.", f"# TYPE {name} histogram"]
+        for stage, row in sorted(stages.items()):
+            for bound, n in zip(self.buckets, row):
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {n}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {row[-2]}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {row[-2]}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {row[-1]:.6f}')
+        for counter, value in sorted(counters.items()):
+            lines.append(f"# TYPE {METRIC_PREFIX}_{counter}_total counter")
+            lines.append(f"{METRIC_PREFIX}_{counter}_total {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+# ---------------- Spans ---------------- #
+
+class _Noop:
+    """Returned by ``span`` and ``trace`` when nothing is recorded."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def breakdown(self) -> List[Dict]:
+        return []
+
+
+_NOOP = _Noop()
+
+
+class Span:
+    __slots__ = ("name", "trace", "parent", "start", "children", "_token")
+
+    def __init__(self, name: str, trace: "Trace"):
+        self.name = name
+        self.trace = trace
+
+    def __enter__(self):
+        self.parent = _span.get()
+        self.children = 0.0
+        self._token = _span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        _span.reset(self._token)
+        if self.parent is not None:
+            self.parent.children += seconds
+        self.trace.add(self.name, seconds, seconds - self.children)
+        if ENABLED:
+            metrics.observe(self.name, seconds)
+        return False
+
+
+class Trace(Span):
+    """
+    The spans and counters of one request.
+
+    ``stages`` maps each span name to its ``count``, ``ms`` (inclusive) and
+    ``self_ms`` (exclusive). A trace only collects the spans of the thread (or
+    context) that entered it.
+    """
+    __slots__ = ("trace_id", "attrs", "started_at", "stages", "counters", "seconds", "_trace_token")
+
+    def __init__(self, name: str, **attrs):
+        super().__init__(name, self)
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.attrs = attrs
+        self.stages = {}
+        self.counters = {}
+        self.seconds = 0.0
+
+    def __enter__(self):
+        self.started_at = time.time()
+        self._trace_token = _trace.set(self)
+        return super().__enter__()
+
+    def __exit__(self, *exc):
+        super().__exit__(*exc)
+        _trace.reset(self._trace_token)
+        self.seconds = time.perf_counter() - self.start
+        if TRACE_LOG:
+            _write_trace(self.record())
+        return False
+
+    def add(self, name: str, seconds: float, self_seconds: float):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = {"count": 0, "ms": 0.0, "self_ms": 0.0}
+        stage["count"] += 1
+        stage["ms"] += seconds * 1000
+        stage["self_ms"] += self_seconds * 1000
+
+    def record(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "start": round(self.started_at, 6),
+            "ms": round(self.seconds * 1000, 3),
+            "attrs": self.attrs,
+            "stages": {name: {k: round(v, 3) for k, v in stage.items()} for name, stage in self.stages.items()},
+            "counters": self.counters,
+        }
+
+    def breakdown(self) -> List[Dict]:
+        """Exclusive time per stage in the order stages first ran; the trace's own name is the time outside them."""
+        return [{"stage": name, "ms": round(stage["self_ms"], 1), "count": stage["count"]}
+                for name, stage in self.stages.items()]
+
+
+def span(name: str):
+    """Times a stage of the current trace (or starts a trace when tracing is on and none is active)."""
+    trace = _trace.get()
+    if trace is None:
+        return Trace(name) if ENABLED else _NOOP
+    return Span(name, trace)
+
+
+def trace(name: str, force: bool = False, **attrs):
+    """Starts a trace; ``force`` collects it even with tracing off, for an in-app breakdown."""
+    if ENABLED or force:
+        return Trace(name, **attrs)
+    return _NOOP
+
+
+def count(name: str, value: float = 1):
+    """Adds to a counter, e.g. chunks embedded or cache hits, in the metrics and the current trace."""
+    trace = _trace.get()
+    if trace is not None:
+        trace.counters[name] = trace.counters.get(name, 0) + value
+    if ENABLED:
+        metrics.count(name, value)
+
+
+def traced(name: str):
+    """Decorator running each call of the function in a ``name`` span."""
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def timed(name: str, iterable: Iterable) -> Iterable:
+    """``iterable`` with the work of producing each item timed as a ``name`` span."""
+    if not ENABLED and _trace.get() is None:
+        return iterable
+    return _timed(name, iter(iterable))
+
+
+def _timed(name: str, iterator: Iterator) -> Iterator:
+    done = object()
+    while True:
+        with span(name):
+            item = next(iterator, done)
+        if item is done:
+            return
+        yield item
+
+# ---------------- Output ---------------- #
+
+_log_lock = threading.Lock()
+
+
+def _write_trace(record: Dict):
+    line = json.dumps(record, default=str) + "\n"
+    with _log_lock, open(TRACE_LOG, "a", encoding="utf-8") as f:
+        f.write(line)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def serve_metrics(port: int = METRICS_PORT, host: str = METRICS_HOST) -> Optional[ThreadingHTTPServer]:
+    """
+    Serves ``/metrics`` on a background thread, once per process.
+
+    Returns the server, or None when ``port`` is 0 or already taken (e.g. by
+    the other Streamlit app), in which case metrics are only logged.
+    """
+    global _server
+    with _server_lock:
+        if _server is not None or not port:
+            return _server
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                data = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        try:
+            _server = ThreadingHTTPServer((host, port), Handler)
+        except OSError:
+            return None
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+        return _server
@@ -0,0 +1,221 @@
+import math
+import os
+from typing import List, Optional
+
+import numpy as np
+from pgvector.sqlalchemy import BIT, HALFVEC
+from sqlalchemy import cast, func, select, text
+
+from ingest import EMBEDDING_DIM, pdf_chunks
+from quantization import RERANK_FACTOR, VECTOR_QUANTIZATION, check_quantization
+from search_scope import SearchScope, scope_condition
+
+# ---------------- Settings ---------------- #
+VECTOR_INDEX = (os.getenv("VECTOR_INDEX") or "hnsw").lower()  # hnsw, ivfflat or none
+INDEX_NAME = "pdf_chunks_embedding_idx"
+BUILD_INDEX_NAME = f"{INDEX_NAME}_new"  # a rebuild is built under this name, then swapped in
+
+HNSW_M = int(os.getenv("HNSW_M") or 16)
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION") or 64)
+DEFAULT_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH") or 40)
+
+# IVFFlat clusters are trained on the rows present at build time, so the index is
+# only built once there is enough data and is rebuilt when the table has grown a lot.
+IVFFLAT_MIN_ROWS = 1000
+IVFFLAT_REBUILD_GROWTH = 2.0
+DEFAULT_PROBES = int(os.getenv("IVFFLAT_PROBES") or 10)
+
+# ---------------- Index management ---------------- #
+
+def _index_target(quantization: str):
+    """
+    (indexed expression, operator class) for a quantization.
+
+    pgvector indexes half-precision and binary forms as expression indexes on
+    the float32 column; it has no int8 vector type.
+    """
+    check_quantization(quantization)
+    if quantization == "none":
+        return "embedding", "vector_l2_ops"
+    if quantization == "half":
+        return f"(embedding::halfvec({EMBEDDING_DIM}))", "halfvec_l2_ops"
+    if quantization == "binary":
+        return f"(binary_quantize(embedding)::bit({EMBEDDING_DIM}))", "bit_hamming_ops"
+    raise ValueError("pgvector has no int8 vectors; use VECTOR_QUANTIZATION=half or binary with PostgreSQL")
+
+
+def estimated_rows(conn) -> int:
+    """Planner estimate of the pdf_chunks row count; falls back to COUNT(*) before the first ANALYZE."""
+    rows = conn.execute(text("SELECT reltuples::bigint FROM pg_class WHERE oid = 'pdf_chunks'::regclass")).scalar()
+    if rows is None or rows < 0:
+        rows = conn.execute(text("SELECT count(*) FROM pdf_chunks")).scalar()
+    return int(rows)
+
+
+def ivfflat_lists(rows: int) -> int:
+    # pgvector's guidance: rows / 1000 up to 1M rows, sqrt(rows) beyond that.
+    return max(1, rows // 1000 if rows <= 1_000_000 else int(math.sqrt(rows)))
+
+
+def _index_info(conn):
+    # Matched through the index's own table, so a same-named index in another schema is never picked up.
+    return conn.execute(text("""
+        SELECT pg_get_indexdef(c.oid) AS indexdef, obj_description(c.oid, 'pg_class') AS built_rows
+        FROM pg_class c
+        JOIN pg_index x ON x.indexrelid = c.oid
+        WHERE c.relname = :name AND x.indrelid = 'pdf_chunks'::regclass
+    """), {"name": INDEX_NAME}).first()
+
+
+def build_vector_index(conn, method: str = VECTOR_INDEX, rows: Optional[int] = None,
+                       quantization: str = VECTOR_QUANTIZATION) -> bool:
+    """
+    (Re)creates the ANN index on pdf_chunks.embedding and records the row count it was built for.
+
+    The index is built with CREATE INDEX CONCURRENTLY under ``BUILD_INDEX_NAME``
+    and only then swapped for the old one, so ingestion and search go on while
+    it builds. That needs an autocommit connection, e.g.
+    ``engine.execution_options(isolation_level="AUTOCOMMIT").connect()``.
+    Returns False without building if another process is already rebuilding.
+    """
+    if method not in ("hnsw", "ivfflat"):
+        raise ValueError(f"Unknown vector index method: {method}")
+    target, opclass = _index_target(quantization)
+    if not conn.execute(text("SELECT pg_try_advisory_lock(hashtext(:name))"), {"name": INDEX_NAME}).scalar():
+        return False
+    try:
+        rows = estimated_rows(conn) if rows is None else rows
+        # An interrupted build leaves an invalid index behind under the build name.
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {BUILD_INDEX_NAME}"))
+        if method == "hnsw":
+            options = f"m = {int(HNSW_M)}, ef_construction = {int(HNSW_EF_CONSTRUCTION)}"
+        else:
+            options = f"lists = {ivfflat_lists(rows)}"
+        conn.execute(text(
+            f"CREATE INDEX CONCURRENTLY {BUILD_INDEX_NAME} ON pdf_chunks USING {method} ({target} {opclass}) "
+            f"WITH ({options})"
+        ))
+        conn.execute(text(f"COMMENT ON INDEX {BUILD_INDEX_NAME} IS '{int(rows)}'"))
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}"))
+        conn.execute(text(f"ALTER INDEX {BUILD_INDEX_NAME} RENAME TO {INDEX_NAME}"))
+    finally:
+        conn.execute(text("SELECT pg_advisory_unlock(hashtext(:name))"), {"name": INDEX_NAME})
+    return True
+
+
+def maintain_vector_index(conn, method: str = VECTOR_INDEX, quantization: str = VECTOR_QUANTIZATION) -> bool:
+    """
+    Makes sure the configured ANN index exists and is still a good fit.
+
+    HNSW is built once and then updated by PostgreSQL on every insert. IVFFlat
+    waits for ``IVFFLAT_MIN_ROWS`` rows and is rebuilt with more lists once the
+    table has grown by ``IVFFLAT_REBUILD_GROWTH``. Returns True if the index was
+    (re)built. Changing ``quantization`` also rebuilds the index. ``conn``
+    must be in autocommit mode, see ``build_vector_index``.
+    """
+    if method == "none":
+        return False
+    info = _index_info(conn)
+    _, opclass = _index_target(quantization)
+    if info is not None and f"USING {method} " in info.indexdef and opclass in info.indexdef:
+        if method != "ivfflat":
+            return False
+        built_rows = int(info.built_rows or 0)
+        rows = estimated_rows(conn)
+        if rows < max(built_rows, 1) * IVFFLAT_REBUILD_GROWTH:
+            return False
+        return build_vector_index(conn, method, rows, quantization)
+    rows = None
+    if method == "ivfflat":
+        rows = estimated_rows(conn)
+        if rows < IVFFLAT_MIN_ROWS:
+            return False
+    return build_vector_index(conn, method, rows, quantization)
+
+# ---------------- Search ---------------- #
+
+def search_chunks(engine, query_emb, top_k: int = 5, ef_search: Optional[int] = None,
+                  probes: Optional[int] = None, quantization: str = VECTOR_QUANTIZATION,
+                  exact: bool = False, scope: Optional[SearchScope] = None) -> List:
+    """
+    Nearest chunks to ``query_emb`` by L2 distance.
+
+    The query vector is bound as a typed ``vector`` parameter, so the statement
+    text is identical for every query. ``ef_search`` (HNSW) and ``probes``
+    (IVFFlat) trade recall for speed and only apply to this query.
+
+    With ``quantization`` the index on the compact form yields ``RERANK_FACTOR``
+    times ``top_k`` candidates, which are re-ranked by their exact float32
+    distance. ``exact=True`` disables index scans for a brute-force reference
+    result, e.g. to measure recall.
+
+    A ``scope`` (see ``search_scope``) is searched exactly: its rows are
+    collected through the (filename, page_number) index in a materialized CTE
+    and only those are ranked. An ANN index can't serve such a query well, as
+    it would rank the whole table and filter afterwards, often returning fewer
+    than ``top_k`` rows for a small document.
+    """
+    columns = [pdf_chunks.c.filename, pdf_chunks.c.page_number, pdf_chunks.c.chunk_id, pdf_chunks.c.text,
+               pdf_chunks.c.start_char, pdf_chunks.c.end_char]
+    limit = top_k
+    if scope is not None:
+        scoped = (
+            select(*columns, pdf_chunks.c.embedding)
+            .where(scope_condition(pdf_chunks, scope))
+            .cte("scoped")
+            .prefix_with("MATERIALIZED")
+        )
+        distance = scoped.c.embedding.l2_distance(query_emb).label("distance")
+        sql = select(*(scoped.c[c.name] for c in columns), distance).order_by(distance).limit(top_k)
+    elif exact or check_quantization(quantization) == "none":
+        distance = pdf_chunks.c.embedding.l2_distance(query_emb).label("distance")
+        sql = select(*columns, distance).order_by(distance).limit(top_k)
+    else:
+        _index_target(quantization)  # rejects int8
+        if quantization == "half":
+            compact = cast(pdf_chunks.c.embedding, HALFVEC(EMBEDDING_DIM)).l2_distance(query_emb)
+        else:
+            compact = cast(func.binary_quantize(pdf_chunks.c.embedding), BIT(EMBEDDING_DIM)).hamming_distance(
+                np.asarray(query_emb) > 0
+            )
+        limit = top_k * RERANK_FACTOR
+        candidates = select(*columns, pdf_chunks.c.embedding).order_by(compact).limit(limit).subquery()
+        distance = candidates.c.embedding.l2_distance(query_emb).label("distance")
+        sql = (
+            select(*(candidates.c[c.name] for c in columns), distance)
+            .order_by(distance)
+            .limit(top_k)
+        )
+    # set_config(..., true) is transaction-local, so the knobs never leak to pooled connections.
+    with engine.begin() as conn:
+        if exact and scope is None:
+            conn.execute(text("SELECT set_config('enable_indexscan', 'off', true)"))
+        if ef_search:
+            conn.execute(text("SELECT set_config('hnsw.ef_search', :value, true)"),
+                         {"value": str(max(int(ef_search), limit))})
+        if probes:
+            conn.execute(text("SELECT set_config('ivfflat.probes', :value, true)"), {"value": str(int(probes))})
+        return list(conn.execute(sql))
+
+
+if __name__ == "__main__":
+    import argparse
+    from sqlalchemy import create_engine
+
+    parser = argparse.ArgumentParser(description="Build or rebuild the ANN index on pdf_chunks.embedding.")
+    parser.add_argument("--method", choices=["hnsw", "ivfflat"], default=VECTOR_INDEX if VECTOR_INDEX != "none" else "hnsw")
+    parser.add_argument("--quantization", choices=["none", "half", "binary"], default=VECTOR_QUANTIZATION,
+                        help="index a compact form of the embeddings")
+    parser.add_argument("--force", action="store_true", help="rebuild even if a suitable index exists")
+    args = parser.parse_args()
+
+    with create_engine(os.environ["DB_URL"]).execution_options(isolation_level="AUTOCOMMIT").connect() as conn:
+        if args.force:
+            if build_vector_index(conn, args.method, quantization=args.quantization):
+                print(f"Rebuilt {args.method} index {INDEX_NAME}.")
+            else:
+                print(f"{INDEX_NAME} is being rebuilt by another process.")
+        elif maintain_vector_index(conn, args.method, args.quantization):
+            print(f"Built {args.method} index {INDEX_NAME}.")
+        else:
+            print(f"{INDEX_NAME} is up to date.")